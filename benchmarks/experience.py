@@ -0,0 +1,66 @@
+# Compares the old loop based xp math with the table backed experience engine
+# Run from the repo root: python -m benchmarks.experience
+
+import random
+import timeit
+from math import floor
+
+import numpy as np
+
+from calcs.experience import level_to_xp, xp_to_level, xp_to_next_levels
+
+SKILLS = 23
+
+
+def old_xp_to_next_level(level):
+    if level == 120:
+        return 0
+    return floor((level - 1) + 300 * (2 ** ((level - 1) / 7))) / 4
+
+
+def old_level_to_xp(level):
+    xp = 0
+    if level >= 120:
+        return 200000000
+    for i in range(2, level + 1):
+        xp += old_xp_to_next_level(i)
+    return xp
+
+
+def old_xp_to_level(xp):
+    level = 1
+    if xp >= 200000000:
+        return 120
+    elif xp == -1:
+        return level
+    while xp >= old_level_to_xp(level):
+        level += 1
+    return level - 1
+
+
+def old_closest(xps):
+    """ The closest_level_up loop as it was """
+    return min(old_level_to_xp(old_xp_to_level(xp) + 1) - xp for xp in xps)
+
+
+def new_closest(xps):
+    """ Same answer from the table with scalar lookups """
+    return min(level_to_xp(xp_to_level(xp) + 1) - xp for xp in xps)
+
+
+def vectorized_closest(xps):
+    """ Same answer in one NumPy call """
+    return xp_to_next_levels(xps).min()
+
+
+if __name__ == '__main__':
+    players = [[random.randint(0, 20000000) for _ in range(SKILLS)] for _ in range(50)]
+    arrays = [np.array(xps) for xps in players]
+    runs = {
+        'loops (old)': lambda: [old_closest(xps) for xps in players],
+        'bisect': lambda: [new_closest(xps) for xps in players],
+        'numpy': lambda: [vectorized_closest(xps) for xps in arrays],
+    }
+    for name, run in runs.items():
+        seconds = timeit.timeit(run, number=3) / (3 * len(players))
+        print(f'{name:12} {seconds * 1e6:10.1f} us per closest_level_up')
@@ -0,0 +1,54 @@
+# Compares the old BeautifulSoup hiscore parsing with parse_index_lite
+# Run from the repo root: python -m benchmarks.hiscore_parse
+
+import random
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from helpers.index_lite import parse_index_lite
+
+PLAYERS = 1000
+
+
+def sample_body():
+    """ Builds an index_lite body shaped like a real one (24 skill rows then 56 activity rows) """
+    rows = [f'{random.randint(1, 2000000)},{random.randint(1, 99)},{random.randint(0, 200000000)}'
+            for _ in range(24)]
+    rows += [f'{random.randint(-1, 500000)},{random.randint(-1, 5000)}' for _ in range(56)]
+    return ('\n'.join(rows) + '\n').encode()
+
+
+def old_parse(content):
+    """ What Hiscore.fetch used to do: soup, split, then int() every field into python objects """
+    doc = BeautifulSoup(content, 'html.parser')
+    first = [i.split() for i in doc]
+    scores = [i.split(',') for i in first[0]]
+    fields = {}
+    for row, values in enumerate(scores):
+        for column, value in enumerate(values):
+            fields[(row, column)] = int(value)
+    levels = [(row, fields[(row, 1)], fields[(row, 2)], fields[(row, 0)]) for row in range(1, 24)]
+    kcs = [(row, fields[(row, 1)], fields[(row, 0)]) for row in range(36, len(scores))]
+    return scores, fields, levels, kcs
+
+
+def memory_per_player(parse, bodies):
+    """ Average bytes kept alive per parsed player """
+    tracemalloc.start()
+    kept = [parse(body) for body in bodies]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size / len(bodies)
+
+
+if __name__ == '__main__':
+    bodies = [sample_body() for _ in range(PLAYERS)]
+    old = timeit.timeit(lambda: [old_parse(b) for b in bodies], number=3) / (3 * PLAYERS)
+    new = timeit.timeit(lambda: [parse_index_lite(b) for b in bodies], number=3) / (3 * PLAYERS)
+    print(f'BeautifulSoup path: {old * 1e6:8.1f} us/lookup  {memory_per_player(old_parse, bodies):8.0f} B/player')
+    print(f'parse_index_lite:   {new * 1e6:8.1f} us/lookup  '
+          f'{memory_per_player(parse_index_lite, bodies):8.0f} B/player')
+    print(f'{old / new:.1f}x faster')
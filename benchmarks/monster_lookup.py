@@ -0,0 +1,36 @@
+# Compares the old linear scan monster lookup with MonsterIndex.lookup
+# Run from the repo root: python -m benchmarks.monster_lookup
+
+import timeit
+
+from osrsbox import monsters_api
+
+from helpers.monsters import MonsterIndex
+
+QUERIES = ['vorkath', 'zulrah', 'goblin', 'dragon', 'demon', 'guard', 'kraken', 'abyssal', 'cave horror', 'xyzzy']
+
+
+def old_lookup(monsters, monster):
+    """ What load_monster_from_api used to do: two full scans then a quadratic dedup """
+    loaded_monster = [x for x in monsters if x.name.lower() == monster.lower()]
+    if len(loaded_monster) == 0:
+        loaded_monster = [x for x in monsters if monster.lower() in x.name.lower()]
+    if len(loaded_monster) == 0:
+        return False
+    returned_monsters = []
+    for x in loaded_monster:
+        if x.name not in [x.name.lower() for x in returned_monsters]:
+            if x.name not in [x.name for x in returned_monsters]:
+                returned_monsters.append(x)
+    return returned_monsters
+
+
+if __name__ == '__main__':
+    monsters = monsters_api.load()
+    index = MonsterIndex()
+    build = timeit.timeit(lambda: index.build(monsters), number=3) / 3
+    for query in QUERIES:
+        old = timeit.timeit(lambda: old_lookup(monsters, query), number=20) / 20
+        new = timeit.timeit(lambda: index.lookup(query), number=200) / 200
+        print(f'{query:12} old {old * 1e3:8.2f} ms  index {new * 1e3:8.3f} ms  {old / new:8.0f}x')
+    print(f'Index build (once, in the background): {build * 1e3:.1f} ms for {len(monsters)} monsters')
@@ -0,0 +1,51 @@
+# Compares parsing graph json on every lookup with cold and warm reads of the memory mapped price history
+# Run from the repo root: python -m benchmarks.price_history
+
+import json
+import tempfile
+import timeit
+
+from helpers.price_history import PriceHistory, DAY_MS, series_from_graph
+
+ITEMS = 200
+# Ten years of daily points per item
+DAYS = 3650
+
+
+def sample_graph(days=DAYS, start=1262304000000):
+    """ Builds a graph json body shaped like the GE's {"daily": {timestamp: price}} """
+    daily = {str(start + day * DAY_MS): 1000 + (day * 37) % 500 for day in range(days)}
+    return json.dumps({'daily': daily, 'average': daily}).encode()
+
+
+def old_read(body):
+    """ What generate_graph used to do: parse the json and copy the dict into lists """
+    graph = json.loads(body)
+    prices = [graph['daily'][data] for data in graph['daily']]
+    average = [graph['average'][data] for data in graph['average']]
+    return prices, average
+
+
+if __name__ == '__main__':
+    body = sample_graph()
+    with tempfile.TemporaryDirectory() as directory:
+        history = PriceHistory(directory, max_open=ITEMS)
+        for item_id in range(ITEMS):
+            history.append(item_id, json.loads(body)['daily'])
+
+        def cold():
+            # New store each time, so every item is mapped again
+            store = PriceHistory(directory)
+            return [store.window(item_id, '1y') for item_id in range(ITEMS)]
+
+        warm_store = PriceHistory(directory, max_open=ITEMS)
+        old = timeit.timeit(lambda: [old_read(body) for _ in range(ITEMS)], number=3) / (3 * ITEMS)
+        cold_time = timeit.timeit(cold, number=3) / (3 * ITEMS)
+        warm = timeit.timeit(lambda: [warm_store.window(i, '1y') for i in range(ITEMS)], number=30) / (30 * ITEMS)
+        full = timeit.timeit(lambda: [warm_store.window(i, 'all') for i in range(ITEMS)], number=30) / (30 * ITEMS)
+        parse = timeit.timeit(lambda: series_from_graph(json.loads(body)['daily']), number=10) / 10
+    print(f'json parse + lists ({DAYS} days): {old * 1e6:9.1f} us/lookup')
+    print(f'memmap cold, 1y window:         {cold_time * 1e6:9.1f} us/lookup')
+    print(f'memmap warm, 1y window:         {warm * 1e6:9.1f} us/lookup')
+    print(f'memmap warm, all time:          {full * 1e6:9.1f} us/lookup')
+    print(f'append parse ({DAYS} days):      {parse * 1e6:9.1f} us/payload')
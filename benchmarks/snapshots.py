@@ -0,0 +1,95 @@
+# Size and window query speed of the hiscore snapshot store before and after retention compaction,
+# over a synthetic year of lookups. Run from the repo root: python -m benchmarks.snapshots [players]
+
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+from helpers.snapshots import SnapshotStore, COLUMNS, DAY, encode
+
+PLAYERS = 10000
+DAYS = 365
+ROWS = 80
+# Lookups per day are log-normal over players: most are looked up now and then, a few many times a day
+MEDIAN_LOOKUPS = 0.2
+MAX_LOOKUPS = 50
+QUERIES = 1000
+
+
+def sample_history(rng, start, lookups):
+    """ A player's snapshots over the year, each lookup a few rows gained xp (and climbed in rank) """
+    taken = np.sort(rng.uniform(start, start + DAYS * DAY, lookups))
+    matrix = np.empty((COLUMNS, ROWS), dtype=np.int64)
+    matrix[0] = rng.integers(1, 2000000, ROWS)
+    matrix[1] = rng.integers(1, 99, ROWS)
+    matrix[2] = rng.integers(0, 50000000, ROWS)
+    matrices = []
+    for _ in range(lookups):
+        matrix = matrix.copy()
+        changed = rng.choice(ROWS, size=min(ROWS, 1 + rng.poisson(3)), replace=False)
+        matrix[0, changed] = np.maximum(matrix[0, changed] - rng.integers(0, 500, len(changed)), 1)
+        matrix[2, changed] += rng.integers(1, 100000, len(changed))
+        matrices.append(matrix)
+    return taken, matrices
+
+
+def build(path, players, start):
+    """ Fills a store with every lookup kept, returns the number of snapshots """
+    rng = np.random.default_rng(0)
+    rates = np.minimum(rng.lognormal(np.log(MEDIAN_LOOKUPS), 1.5, players), MAX_LOOKUPS)
+    store = SnapshotStore(path)
+    connection = store.connect()
+    total = 0
+    with connection:
+        for player in range(players):
+            lookups = max(1, rng.poisson(rates[player] * DAYS))
+            taken, matrices = sample_history(rng, start, lookups)
+            connection.execute('INSERT INTO players VALUES (?, ?, 0)', (f'player {player}', taken[-1]))
+            connection.executemany('INSERT INTO snapshot_rows VALUES (?, ?, ?, ?)',
+                                   [(f'player {player}', *row) for row in encode(taken, matrices)])
+            total += lookups
+    store.close()
+    return total
+
+
+def query_time(store, players, now):
+    """ Average seconds per window query over random players and windows """
+    picks = [(f'player {random.randrange(players)}', now - random.choice((7, 30, 365)) * DAY)
+             for _ in range(QUERIES)]
+    return timeit.timeit(lambda: [store.read_history(player, since) for (player, since) in picks],
+                         number=1) / QUERIES
+
+
+if __name__ == '__main__':
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else PLAYERS
+    now = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshots.db')
+        started = time.perf_counter()
+        total = build(path, players, now - DAYS * DAY)
+        print(f'{players:,} players, {total:,} snapshots built in {time.perf_counter() - started:.1f}s')
+        print(f'full rows (old layout):    {total * COLUMNS * ROWS * 8 / 2 ** 20:9.1f} MiB of blobs')
+        print(f'keyframes and deltas:      {os.path.getsize(path) / 2 ** 20:9.1f} MiB on disk')
+
+        store = SnapshotStore(path)
+        print(f'window query, all kept:    {query_time(store, players, now) * 1e6:9.1f} us')
+        started = time.perf_counter()
+        compacted = dropped = 0
+        while True:
+            (batch, batch_dropped) = store.compact_batch(now)
+            compacted += batch
+            dropped += batch_dropped
+            if batch == 0:
+                break
+        elapsed = time.perf_counter() - started
+        store.connect().execute('VACUUM')
+        print(f'compaction:                {elapsed:9.1f} s, dropped {dropped:,} snapshots '
+              f'({elapsed / compacted * 1e3:.2f} ms/player)')
+        print(f'after retention:           {os.path.getsize(path) / 2 ** 20:9.1f} MiB on disk')
+        print(f'window query, compacted:   {query_time(store, players, now) * 1e6:9.1f} us')
+        store.close()
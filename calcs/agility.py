@@ -1,6 +1,6 @@
 # Agility rooftop course calculator
 
-from calcs.experience import level_to_xp
+from calcs.experience import level_to_xp, xp_to_next
 from helpers.hiscore import Hiscore
 
 DRAYNOR_LEVEL = 10
@@ -22,6 +22,19 @@ RELLEKKA_LAP = 780
 ARDOUGNE_LEVEL = 90
 ARDOUGNE_LAP = 793
 
+# Level the next course (or 99 from Ardougne) unlocks at, keyed by current course
+NEXT_COURSE_LEVEL = {
+    'Draynor': AL_KHARID_LEVEL,
+    'Al Kharid': VARROCK_LEVEL,
+    'Varrock': CANIFIS_LEVEL,
+    'Canifis': FALADOR_LEVEL,
+    'Falador': SEERS_LEVEL,
+    'Seers': POLLNIVEACH_LEVEL,
+    'Pollniveach': RELLEKKA_LEVEL,
+    'Rellekka': ARDOUGNE_LEVEL,
+    'Ardougne': 99,
+}
+
 
 class Agility(Hiscore):
     """ Agility rooftop course calculator """
@@ -73,7 +86,7 @@ class Agility(Hiscore):
 
     def xp_needed_to_level_up(self):
         """ Returns the amount of xp needed to level up """
-        return level_to_xp(self.agility_level + 1) - self.agility_xp
+        return xp_to_next(self.agility_xp)
 
     def laps_to_level_up(self):
         """ Returns number of laps on highest available course to level up """
@@ -81,24 +94,8 @@ class Agility(Hiscore):
 
     def laps_to_next_course(self):
         """ Returns number of laps until user can access next course """
-        if self.determine_course() == 'Draynor':
-            return (level_to_xp(20) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Al Kharid':
-            return (level_to_xp(30) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Varrock':
-            return (level_to_xp(40) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Canifis':
-            return (level_to_xp(50) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Falador':
-            return (level_to_xp(60) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Seers':
-            return (level_to_xp(70) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Pollniveach':
-            return (level_to_xp(80) - self.agility_xp) // self.lap_xp + 1
-        elif self.determine_course() == 'Rellekka':
-            return (level_to_xp(90) - self.agility_xp) // self.lap_xp + 1
-        else:
-            return (level_to_xp(99) - self.agility_xp) // self.lap_xp + 1
+        unlock_level = NEXT_COURSE_LEVEL[self.determine_course()]
+        return (level_to_xp(unlock_level) - self.agility_xp) // self.lap_xp + 1
 
 # Ex
 # 70 Agility (blah xp)
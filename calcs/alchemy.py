@@ -1,29 +1,36 @@
 # High alch calculator
 
-from calcs.experience import LEVEL_99, level_to_xp, xp_to_level
-from helpers.ge import GrandExchange
+import asyncio
+
+from calcs.experience import LEVEL_99, xp_to_next
+from helpers.ge import NoResults
 from helpers.hiscore import Hiscore
+from helpers.prices import fetch_prices
 
 HIGH_ALCH_XP = 65
 ALCHS_PER_HR = 1200
 
 
-class Alchemy(Hiscore, GrandExchange):
+class Alchemy(Hiscore):
     """ High alch calculator """
 
     def __init__(self, username):
         self.username = username
+        self.icon = None
+        self.current_price = None
 
     async def fetch(self):
-        """ Fetch the results """
+        """ Fetch the results, only the nature rune's price is needed from the GE """
         Hiscore.__init__(self, self.username)
-        GrandExchange.__init__(self, "Nature rune")
-        await Hiscore.fetch(self)
-        await GrandExchange.fetch(self)
+        _, (natures,) = await asyncio.gather(Hiscore.fetch(self), fetch_prices(["Nature rune"]))
+        if not natures.found:
+            raise NoResults('The price of nature runes is unavailable at this time')
+        self.icon = natures.icon
+        self.current_price = natures.price
 
     def alchs_to_level_up(self):
         """ Returns number of alchs needed to level up """
-        needed = level_to_xp(xp_to_level(self.magic_xp) + 1) - self.magic_xp
+        needed = xp_to_next(self.magic_xp)
         return (needed // HIGH_ALCH_XP) + 1
 
     def price_to_level_up(self):
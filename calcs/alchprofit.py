@@ -0,0 +1,87 @@
+# Ranks every tradeable item by high alch profit, from the crawled GE price table
+
+import asyncio
+
+import numpy as np
+
+from calcs.alchemy import ALCHS_PER_HR
+from helpers.itemdb import item_db
+from helpers.price_table import price_table
+
+NATURE_RUNE_ID = 561
+# GE buy limits reset every 4 hours
+BUY_LIMIT_HOURS = 4
+TOP_ITEMS = 10
+
+RANKING_DTYPE = np.dtype([('id', np.int32), ('price', np.int64), ('highalch', np.int64), ('buy_limit', np.int64),
+                          ('profit', np.int64), ('casts_per_hr', np.int64), ('profit_per_hr', np.int64)])
+
+
+class AlchProfit:
+    """ Top high alch items by profit per hour, recomputed in one vectorized pass whenever the price table changes """
+
+    def __init__(self, top=TOP_ITEMS):
+        self.top = top
+        self.version = None
+        self.ranking = np.zeros(0, dtype=RANKING_DTYPE)
+        self.nature_price = None
+        # highalch and buy_limit lined up with the price table's ids, these don't change between crawls
+        self.item_ids = None
+        self.highalch = None
+        self.buy_limit = None
+
+    def item_arrays(self, ids):
+        """ Returns highalch and buy_limit arrays lined up with ids, 0 where osrsbox has no value """
+        if self.item_ids is None or not np.array_equal(self.item_ids, ids):
+            items = [item_db.get(item_id) for item_id in ids]
+            self.highalch = np.array([(item.highalch or 0) if item else 0 for item in items], dtype=np.int64)
+            self.buy_limit = np.array([(item.buy_limit or 0) if item else 0 for item in items], dtype=np.int64)
+            self.item_ids = ids.copy()
+        return self.highalch, self.buy_limit
+
+    def compute(self):
+        """ Ranks every priced item by (highalch - price - nature rune) per cast, times the casts per hour
+        its buy limit allows """
+        version = price_table.version
+        rows = price_table.rows
+        position = price_table.position(NATURE_RUNE_ID)
+        if position is None or rows['price'][position] <= 0:
+            return
+        nature_price = int(rows['price'][position])
+        highalch, buy_limit = self.item_arrays(rows['id'])
+        profit = highalch - rows['price'] - nature_price
+        # Items without a known limit are only capped by how fast you can cast
+        casts_per_hr = np.where(buy_limit > 0, np.minimum(buy_limit // BUY_LIMIT_HOURS, ALCHS_PER_HR), ALCHS_PER_HR)
+        profit_per_hr = profit * casts_per_hr
+        valid = np.flatnonzero((rows['price'] > 0) & (highalch > 0) & (profit > 0))
+        best = valid[np.argsort(-profit_per_hr[valid], kind='stable')[:self.top]]
+        ranking = np.zeros(len(best), dtype=RANKING_DTYPE)
+        ranking['id'] = rows['id'][best]
+        ranking['price'] = rows['price'][best]
+        ranking['highalch'] = highalch[best]
+        ranking['buy_limit'] = buy_limit[best]
+        ranking['profit'] = profit[best]
+        ranking['casts_per_hr'] = casts_per_hr[best]
+        ranking['profit_per_hr'] = profit_per_hr[best]
+        self.ranking, self.nature_price, self.version = ranking, nature_price, version
+
+    async def refresh(self):
+        """ Recomputes the ranking if the price table changed since the last one """
+        if self.version == price_table.version:
+            return
+        await asyncio.gather(item_db.load(), price_table.load())
+        self.compute()
+
+    async def fetch(self):
+        """ Returns the ranking as a list of dicts with item names, best first """
+        await self.refresh()
+        results = []
+        for row in self.ranking:
+            item = item_db.get(row['id'])
+            results.append({'name': item.name if item else f'Item {row["id"]}',
+                            **{field: int(row[field]) for field in RANKING_DTYPE.names}})
+        return results
+
+
+# Shared by the alchprofit command and the price crawler
+alch_profit = AlchProfit()
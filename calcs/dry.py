@@ -0,0 +1,136 @@
+# How dry a player is on a monster's drops, in closed form and by Monte Carlo simulation
+
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from helpers.cache import SingleFlight
+from helpers.monsters import monster_index
+
+# Drops at least this rare count as uniques for the collection log
+UNIQUE_RARITY = 1 / 100
+# Simulation settings
+MAX_TRIALS = 5000000
+TRIALS_PER_CHUNK = 250000
+TIME_BUDGET = 2.0
+# The simulated kills-to-drop distribution is kept as this many quantiles
+QUANTILES = 1000
+DRY_WORKERS = 1
+# Distributions kept, least recently used dropped first
+MAX_CACHED_DISTRIBUTIONS = 500
+
+
+def simulate(rates, max_trials=MAX_TRIALS, budget=TIME_BUDGET, seed=None):
+    """ Samples kills needed to get every drop in rates (one geometric draw per drop, the log is done at the
+    slowest), in chunks until max_trials or the time budget runs out. Returns (quantiles, trials).
+    Runs in a worker process """
+    rng = np.random.default_rng(seed)
+    rates = np.asarray(rates, dtype=np.float64)
+    started = time.monotonic()
+    chunks = []
+    trials = 0
+    while trials < max_trials and (trials == 0 or time.monotonic() - started < budget):
+        size = min(TRIALS_PER_CHUNK, max_trials - trials)
+        chunks.append(rng.geometric(rates, size=(size, len(rates))).max(axis=1))
+        trials += size
+    kills = np.concatenate(chunks)
+    return np.quantile(kills, np.linspace(0, 1, QUANTILES + 1)), trials
+
+
+def chance_by(rates, kc):
+    """ Closed form chance of having every drop in rates by kc kills """
+    return float(np.prod(1 - (1 - np.asarray(rates, dtype=np.float64)) ** kc))
+
+
+class DrySimulator:
+    """ Runs simulations in a process pool, caching each distribution per (monster, drop set) """
+
+    def __init__(self, workers=DRY_WORKERS, max_results=MAX_CACHED_DISTRIBUTIONS):
+        self.workers = workers
+        self.max_results = max_results
+        self.pool = None
+        self.results = OrderedDict()
+        self.flights = SingleFlight()
+
+    def get_pool(self):
+        """ Returns the process pool, starting it on first use """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    async def distribution(self, key, rates):
+        """ Returns (quantiles, trials) of the kills needed for every drop in rates """
+        result = self.results.get(key)
+        if result is None:
+            return await self.flights.run(key, lambda: self.load(key, rates))
+        self.results.move_to_end(key)
+        return result
+
+    async def load(self, key, rates):
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(self.get_pool(), simulate, rates)
+        self.results[key] = result
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+        return result
+
+    def close(self):
+        """ Stops the worker processes """
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+class Dry:
+    """ Dry streak calculator for one monster's drop, or every unique in its log when item is empty """
+
+    def __init__(self, monster, item, kc):
+        self.monster = monster
+        self.item = item
+        self.kc = kc
+        self.drops = []
+        self.rates = []
+        self.chance = None
+        self.simulated_chance = None
+        self.trials = None
+        self.median = None
+        self.kc_90 = None
+        self.kc_99 = None
+
+    def find_drops(self):
+        """ Picks the (name, rate) drops asked for, raises NoDrop if there aren't any """
+        summary = monster_index.drop_summary(self.monster)
+        if self.item:
+            rates = {}
+            for (name, _, rarity) in summary:
+                if name.lower() == self.item.lower():
+                    # The same item on several rolls
+                    rates[name] = 1 - (1 - rates.get(name, 0)) * (1 - rarity)
+        else:
+            rates = {name: rarity for (name, _, rarity) in summary if rarity <= UNIQUE_RARITY}
+        if not rates:
+            raise NoDrop(f'{self.monster.name} has no {self.item or "unique"} drops')
+        self.drops = sorted(rates)
+        self.rates = [rates[name] for name in self.drops]
+
+    async def fetch(self):
+        """ Works out the chances, the simulation is shared by everyone asking about the same drops """
+        self.find_drops()
+        self.chance = chance_by(self.rates, self.kc)
+        key = (self.monster.id, tuple(self.drops))
+        quantiles, self.trials = await dry_simulator.distribution(key, self.rates)
+        self.simulated_chance = np.searchsorted(quantiles, self.kc, side='right') / len(quantiles)
+        self.median = int(quantiles[QUANTILES // 2])
+        self.kc_90 = int(quantiles[QUANTILES * 9 // 10])
+        self.kc_99 = int(quantiles[QUANTILES * 99 // 100])
+
+
+class NoDrop(Exception):
+    pass
+
+
+# Shared by the dry command
+dry_simulator = DrySimulator()
@@ -1,45 +1,73 @@
 # Calculates experience
+from bisect import bisect_right
 from math import floor
 
+import numpy as np
+
 LEVEL_99 = 13034431
+MAX_LEVEL = 126
+MAX_XP = 200000000
+
 
+def build_xp_table():
+    """ Returns a list where index n is the xp needed for level n, index 0 is unused """
+    table = [0, 0]
+    points = 0
+    for level in range(1, MAX_LEVEL):
+        points += floor(level + 300 * 2 ** (level / 7))
+        table.append(points // 4)
+    return table
 
-def xp_to_next_level(level):
-    """ Returns xp to next level up """
-    if level == 120:
-        return 0
-    return floor((level - 1) + 300 * (2 ** ((level - 1) / 7))) / 4
+
+XP_TABLE = build_xp_table()
+# XP for levels 1 to 126, then the 200m cap standing in for "level 127"
+TARGET_XP = np.array(XP_TABLE[1:] + [MAX_XP], dtype=np.int64)
 
 
 def level_to_xp(level):
-    """ Converts level number to xp, handles virtual levels"""
-    xp = 0
-    if level >= 120:
-        return 200000000
-    for i in range(2, level + 1):
-        xp += xp_to_next_level(i)
-    return xp
+    """ Converts level number to xp, handles virtual levels. Anything past 126 is the 200m cap """
+    if level > MAX_LEVEL:
+        return MAX_XP
+    return XP_TABLE[max(level, 1)]
 
 
 def xp_to_level(xp):
     """ Converts xp to level number, handles virtual levels """
-    level = 1
-    if xp >= 200000000:
-        return 120
-    elif xp == -1:
-        return level
-    while xp >= level_to_xp(level):
-        level += 1
-    return level - 1
+    return min(max(bisect_right(XP_TABLE, xp, 1) - 1, 1), MAX_LEVEL)
+
+
+def xp_to_next(xp):
+    """ Returns xp needed for the next (virtual) level, or to 200m past level 126 """
+    return max(level_to_xp(xp_to_level(xp) + 1) - xp, 0)
+
+
+def levels_for_xp(xps):
+    """ Vectorized xp_to_level over an array of xp values """
+    return np.clip(np.searchsorted(TARGET_XP[:-1], xps, side='right'), 1, MAX_LEVEL)
+
+
+def xp_to_next_levels(xps):
+    """ Vectorized xp_to_next over an array of xp values """
+    xps = np.asarray(xps, dtype=np.int64)
+    return np.maximum(TARGET_XP[levels_for_xp(xps)] - xps, 0)
+
+
+def xp_to_targets(xps, targets):
+    """ Vectorized xp needed to reach target levels (scalar or array, 127 means 200m), never negative """
+    xps = np.asarray(xps, dtype=np.int64)
+    targets = np.clip(np.asarray(targets), 1, MAX_LEVEL + 1)
+    return np.maximum(TARGET_XP[targets - 1] - xps, 0)
 
 
 def next_level_string(xp, skill):
     """ Returns string representation of next level of skill, takes into account virtual levels """
+    if xp >= MAX_XP:
+        return "Maxed!"
     level = xp_to_level(xp)
+    if level == MAX_LEVEL:
+        return f'{MAX_XP - xp:,.0f} xp to 200m {skill}'
     next_level = level + 1
     next_xp = level_to_xp(next_level) - xp
-    if xp == 200000000:
-        return "Maxed!"
     if xp > LEVEL_99:
         skill = f'{skill} (virtual level)'
     else:
@@ -47,11 +75,8 @@ def next_level_string(xp, skill):
     return f'{next_xp:,.0f} xp to {next_level} {skill}'
 
 # Test code
-# test_level = 40
-# print("XP to level", test_level + 1, xp_to_next_level(test_level))
-# print("Total xp at level", test_level, level_to_xp(test_level))
-
 # test_xp = 14000000
 # print(next_level_string(test_xp, "Attack"))
 # print("Level to XP", level_to_xp(101))
 # print("XP to level", xp_to_level(16000000))
+# print("Levels", levels_for_xp([0, 83, 13034431, 200000000]))
@@ -0,0 +1,132 @@
+# Expected loot value per kill from a monster's drop table and GE prices
+
+import re
+import time
+
+import numpy as np
+
+from helpers.ge import price_cache
+from helpers.itemdb import item_db
+from helpers.price_table import price_table
+from helpers.prices import fetch_prices
+
+COINS_ID = 995
+# Most valuable drops listed on the embed
+TOP_DROPS = 5
+MAX_CACHED_LOOT = 500
+# Loot priced while some drops couldn't be looked up is only reused this long (seconds)
+PARTIAL_LOOT_TTL = 60
+
+
+def expected_quantity(quantity):
+    """ Average amount of one drop, osrsbox quantities look like "1", "5-10", "3,5,7" or "250 (noted)" """
+    if quantity is None:
+        return 1.0
+    amounts = []
+    for part in re.split(r'[,;]', str(quantity)):
+        numbers = [int(number) for number in re.findall(r'\d+', part)]
+        if numbers:
+            # A range averages its ends
+            amounts.append((numbers[0] + numbers[-1]) / 2)
+    return sum(amounts) / len(amounts) if amounts else 1.0
+
+
+class LootTable:
+    """ A monster's drops as parallel arrays: unnoted item ids and expected amount per kill (rarity x quantity) """
+
+    def __init__(self, monster):
+        names, ids, weights = [], [], []
+        for drop in monster.drops:
+            item = item_db.find(drop.name)
+            if item is None:
+                continue
+            rolls = getattr(drop, 'rolls', 1) or 1
+            names.append(drop.name)
+            ids.append(item.id)
+            weights.append(drop.rarity * expected_quantity(drop.quantity) * rolls)
+        self.names = names
+        self.ids = np.array(ids, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+
+
+class LootCache:
+    """ Loot tables per monster id, and priced loot per (monster id, GE update) """
+
+    def __init__(self, max_loot=MAX_CACHED_LOOT):
+        self.max_loot = max_loot
+        self.tables = {}
+        # (monster id, GE update) -> (epoch time it expires, or None to keep it for the whole update, value)
+        self.values = {}
+
+    def table(self, monster):
+        table = self.tables.get(monster.id)
+        if table is None:
+            table = LootTable(monster)
+            self.tables[monster.id] = table
+        return table
+
+    async def prices(self, ids):
+        """ Price of every id in one batch: fresh price table rows, then one concurrent lookup for the rest.
+        Coins are worth 1, items the GE doesn't trade are worth 0.
+        Returns (prices, whether every lookup found its item) """
+        rows = price_table.rows
+        prices = np.zeros(len(ids), dtype=np.float64)
+        positions = np.minimum(np.searchsorted(rows['id'], ids), max(len(rows) - 1, 0))
+        if len(rows):
+            traded = rows['id'][positions] == ids
+            fresh = traded & price_table.fresh_rows()[positions] & (rows['price'][positions] >= 0)
+            prices[fresh] = rows['price'][positions[fresh]]
+            stale = np.flatnonzero(traded & ~fresh)
+        else:
+            # No table yet, every id has to be looked up
+            stale = np.flatnonzero(ids != COINS_ID)
+        complete = True
+        if len(stale):
+            item_prices = await fetch_prices([str(item_id) for item_id in ids[stale]])
+            prices[stale] = [item.price if item.found else 0 for item in item_prices]
+            complete = all(item.found for item in item_prices)
+        prices[ids == COINS_ID] = 1
+        return prices, complete
+
+    async def value(self, monster):
+        """ Returns (expected gp per kill, [(drop name, gp per kill)] most valuable first) """
+        key = (monster.id, price_cache.latest_update)
+        entry = self.values.get(key)
+        if entry is not None and (entry[0] is None or entry[0] > time.time()):
+            return entry[1]
+        table = self.table(monster)
+        prices, complete = await self.prices(table.ids)
+        contributions = table.weights * prices
+        total = float(table.weights @ prices)
+        best = np.argsort(-contributions, kind='stable')[:TOP_DROPS]
+        value = (total, [(table.names[i], float(contributions[i])) for i in best if contributions[i] > 0])
+        # Drops that failed to price count as 0, so that value is retried soon instead of kept all update
+        self.values.pop(key, None)
+        self.values[key] = (None if complete else time.time() + PARTIAL_LOOT_TTL, value)
+        while len(self.values) > self.max_loot:
+            del self.values[next(iter(self.values))]
+        return value
+
+
+class Loot:
+    """ Expected loot calculator for one monster """
+
+    def __init__(self, monster, kills_per_hr=None):
+        self.monster = monster
+        self.kills_per_hr = kills_per_hr
+        self.per_kill = None
+        self.top_drops = []
+
+    async def fetch(self):
+        """ Prices the monster's drop table """
+        self.per_kill, self.top_drops = await loot_cache.value(self.monster)
+
+    def per_hour(self):
+        """ Returns expected gp per hour, or None without a kill rate """
+        if self.kills_per_hr is None:
+            return None
+        return self.per_kill * self.kills_per_hr
+
+
+# Shared by the loot command
+loot_cache = LootCache()
@@ -0,0 +1,81 @@
+# Boss pet chances from hiscore kill counts
+
+import json
+
+import numpy as np
+from tabulate import tabulate
+
+from helpers.hiscore import Hiscore
+
+PET_RATES_PATH = 'assets/pet_rates.json'
+
+
+def read_pet_rates():
+    """ Reads the boss name -> 1 in N pet rate table """
+    with open(PET_RATES_PATH) as file:
+        return json.load(file)
+
+
+PET_RATES = read_pet_rates()
+
+
+def pet_chances(kcs, rates):
+    """ Vectorized over the last axis (bosses), kcs can be one player or a (players, bosses) roster.
+    Returns the chance of at least one pet, expected pets, and the kc where the chance reaches 50% and 90% """
+    kcs = np.maximum(np.asarray(kcs, dtype=np.float64), 0)
+    misses = np.log1p(-rates)
+    chance = -np.expm1(kcs * misses)
+    expected = kcs * rates
+    kc_50 = np.ceil(np.log(0.5) / misses)
+    kc_90 = np.ceil(np.log(0.1) / misses)
+    return chance, expected, kc_50, kc_90
+
+
+class PetRows:
+    """ The kc rows of one hiscore layout that have a pet, with their rates """
+
+    def __init__(self, schema):
+        bosses = [(name, row) for (name, row) in schema.kc_rows if name in PET_RATES]
+        self.names = [name for (name, _) in bosses]
+        self.rows = np.array([row for (_, row) in bosses], dtype=np.intp)
+        self.rates = np.array([1 / PET_RATES[name] for name in self.names], dtype=np.float64)
+
+
+# Layout version -> PetRows
+pet_rows = {}
+
+
+def rows_for(schema):
+    rows = pet_rows.get(schema.version)
+    if rows is None:
+        rows = PetRows(schema)
+        pet_rows[schema.version] = rows
+    return rows
+
+
+class Pets(Hiscore):
+    """ Pet chance report for every boss a player has killed """
+
+    def pet_report(self):
+        """ Returns (boss, kc, chance, expected pets, kc to 50%, kc to 90%) for every killed boss with a pet,
+        likeliest pet first, so the top of the list is where being petless is unluckiest """
+        rows = rows_for(self.snapshot.schema)
+        kcs = np.frombuffer(self.snapshot.score, dtype=np.int64)[rows.rows]
+        chance, expected, kc_50, kc_90 = pet_chances(kcs, rows.rates)
+        killed = np.flatnonzero(kcs > 0)
+        order = killed[np.argsort(-chance[killed], kind='stable')]
+        return [(rows.names[i], int(kcs[i]), float(chance[i]), float(expected[i]), int(kc_50[i]), int(kc_90[i]))
+                for i in order]
+
+    def expected_pets(self):
+        """ Expected number of pets over every boss """
+        return sum(expected for (_, _, _, expected, _, _) in self.pet_report())
+
+    def generate_pet_table(self, limit=15):
+        """ Returns a formatted table of the likeliest pets, or None if no bosses were killed """
+        report = self.pet_report()
+        if len(report) == 0:
+            return None
+        results = [(name, f'{kc:,}', f'{chance:.1%}', f'{kc_50:,}') for (name, kc, chance, _, kc_50, _)
+                   in report[:limit]]
+        return tabulate(results, headers=['Boss', 'KC', 'Chance', '50% at'], tablefmt='plain')
@@ -0,0 +1,126 @@
+# Recent xp and kill count rates fitted over a player's stored hiscore snapshots, and ETAs from them
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from calcs.experience import LEVEL_99, xp_to_next_levels, xp_to_targets, MAX_LEVEL
+from helpers.hiscore import canonical_username
+from helpers.hiscore_schema import SCHEMAS, LATEST
+from helpers.snapshots import snapshot_store, DAY
+
+# Rates are fitted over this window of snapshots
+PROJECTION_DAYS = 30
+# Less history than this falls back to the lifetime averages
+MIN_SNAPSHOTS = 3
+MIN_SPAN_DAYS = 2
+MAX_CACHED_PROJECTIONS = 1000
+
+
+def fit_rates(days, values):
+    """ Least squares slope of every column of values (snapshots, columns) against days, in one solve.
+    Rates never go below 0, hiscore xp and kill counts only drop when a row falls off the rankings """
+    design = np.column_stack([days - days[0], np.ones(len(days))])
+    (coefficients, _, _, _) = np.linalg.lstsq(design, values.astype(np.float64), rcond=None)
+    return np.maximum(coefficients[0], 0)
+
+
+def days_to(needed, rates):
+    """ Days to gain needed at rates, 0 when nothing is needed, inf when there's no progress """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days = np.where(needed > 0, needed / rates, 0)
+    return np.where((needed > 0) & (rates <= 0), np.inf, days)
+
+
+def eta_string(days):
+    """ Formats an ETA in days the way the calculator embeds show it, ~3 days """
+    if days is None or not np.isfinite(days):
+        return 'never at this rate'
+    for (unit, length) in (('year', 365), ('day', 1), ('hour', 1 / 24)):
+        if days >= length:
+            count = int(days // length)
+            return f'~{count:,} {unit}{"s" if count > 1 else ""}'
+    return 'under an hour'
+
+
+class Projection:
+    """ Rates per day for every xp and score row of a player's hiscore, and skill ETAs to the next level,
+    99 and 200m, all fitted from the snapshots of the last PROJECTION_DAYS """
+
+    def __init__(self, history):
+        self.schema = SCHEMAS.get(history.xp.shape[1], LATEST)
+        days = history.taken / DAY
+        xp = np.maximum(history.xp, 0)
+        score = np.maximum(history.score, 0)
+        if history.checked > history.taken[-1]:
+            # Nothing changed between the last snapshot and the last check, which counts as a point too
+            days = np.append(days, history.checked / DAY)
+            xp = np.vstack([xp, xp[-1]])
+            score = np.vstack([score, score[-1]])
+        self.snapshots = len(days)
+        self.span = days[-1] - days[0]
+        self.xp_rates = fit_rates(days, xp)
+        self.score_rates = fit_rates(days, score)
+        self.xp = xp[-1]
+        self.eta_next = days_to(xp_to_next_levels(self.xp), self.xp_rates)
+        self.eta_99 = days_to(np.maximum(LEVEL_99 - self.xp, 0), self.xp_rates)
+        self.eta_max = days_to(xp_to_targets(self.xp, MAX_LEVEL + 1), self.xp_rates)
+
+    @property
+    def enough(self):
+        """ Whether there's enough history for the rates to mean anything """
+        return self.snapshots >= MIN_SNAPSHOTS and self.span >= MIN_SPAN_DAYS
+
+    def rate(self, field):
+        """ Gain per day of a hiscore field, slayer_xp or kc_wintertodt """
+        if field not in self.schema.fields:
+            return 0.0
+        (column, row) = self.schema.fields[field]
+        return float(self.score_rates[row] if column == 'score' else self.xp_rates[row])
+
+    def eta(self, skill):
+        """ Returns the days to the next level, 99 and 200m of a skill (inf when it isn't being trained) """
+        (_, row) = self.schema.fields[f'{skill}_xp']
+        return float(self.eta_next[row]), float(self.eta_99[row]), float(self.eta_max[row])
+
+    def summary(self, skill):
+        """ Returns the recent rate and ETAs of a skill as embed field text """
+        (next_level, level_99, max_xp) = self.eta(skill)
+        lines = [f'{self.rate(f"{skill}_xp"):,.0f} xp/day', f'Level up {eta_string(next_level)}']
+        if level_99 > 0:
+            lines.append(f'99 {eta_string(level_99)}')
+        else:
+            lines.append(f'200m {eta_string(max_xp)}')
+        return '\n'.join(lines)
+
+
+class ProjectionCache:
+    """ Projections per (player, latest snapshot), refitted only when a new snapshot is stored """
+
+    def __init__(self, max_players=MAX_CACHED_PROJECTIONS):
+        self.max_players = max_players
+        self.entries = OrderedDict()
+
+    async def get(self, username):
+        """ Returns the player's Projection, None when fewer than MIN_SNAPSHOTS are stored or they span too little.
+        The last check extends the fit, so a projection is also refitted once a day while nothing changes """
+        key = canonical_username(username)
+        seen = await snapshot_store.last_seen(key)
+        if seen is None:
+            return None
+        (taken, checked) = seen
+        entry = self.entries.get((key, taken))
+        if entry is None or entry[0] != checked // DAY:
+            history = await snapshot_store.history(key, time.time() - PROJECTION_DAYS * DAY)
+            if history is None:
+                return None
+            entry = (checked // DAY, Projection(history))
+            self.entries[(key, taken)] = entry
+            while len(self.entries) > self.max_players:
+                self.entries.popitem(last=False)
+        return entry[1] if entry[1].enough else None
+
+
+# Shared by the calculators
+projection_cache = ProjectionCache()
@@ -1,6 +1,7 @@
 # Slayer task calculator
 
-from calcs.experience import level_to_xp, LEVEL_99
+from calcs.experience import xp_to_next, LEVEL_99
+from calcs.projection import projection_cache
 from helpers.hiscore import Hiscore
 
 
@@ -10,10 +11,16 @@ class Tasks(Hiscore):
     def __init__(self, username, tasks):
         super().__init__(username)
         self.tasks = int(tasks)
+        self.projection = None
+
+    async def fetch(self):
+        """ Fetch the results, and the recent slayer rate when enough history is stored """
+        await super().fetch()
+        self.projection = await projection_cache.get(self.username)
 
     def xp_needed_to_level_up(self):
         """ Returns xp needed to level up """
-        return level_to_xp(self.slayer_level + 1) - self.slayer_xp
+        return xp_to_next(self.slayer_xp)
 
     def avg_xp_per_task(self):
         """ Returns average xp per task """
@@ -1,6 +1,6 @@
 # Wine calculator for cooking
 
-from calcs.experience import LEVEL_99
+from calcs.experience import LEVEL_99, MAX_XP
 from helpers.hiscore import Hiscore
 
 WINE_XP = 200
@@ -20,8 +20,8 @@ class Wines(Hiscore):
 
     def wines_to_200m(self):
         """ Returns number of wines to reach 200m xp """
-        return (200000000 - self.cooking_xp) // WINE_XP
+        return (MAX_XP - self.cooking_xp) // WINE_XP
 
     def invs_to_200m(self):
         """ Returns number of wines to reach 200m xp """
-        return (200000000 - self.cooking_xp) // WINE_XP_PER_INV
+        return (MAX_XP - self.cooking_xp) // WINE_XP_PER_INV
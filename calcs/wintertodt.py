@@ -1,17 +1,39 @@
-from calcs.experience import LEVEL_99, level_to_xp
+from calcs.experience import LEVEL_99, xp_to_next
+from calcs.projection import projection_cache
 from helpers.hiscore import Hiscore
 
 
 class Wintertodt(Hiscore):
     """ Used to calculate information about Wintertodt """
 
-    # Average xp per kill
+    def __init__(self, username):
+        super().__init__(username)
+        self.projection = None
+
+    # Fetch the results, and the recent rates when enough history is stored
+    async def fetch(self):
+        await super().fetch()
+        self.projection = await projection_cache.get(self.username)
+
+    # Firemaking xp per kill lately, None without enough history or recent kills
+    def recent_average(self):
+        if self.projection is None:
+            return None
+        kills = self.projection.rate('kc_wintertodt')
+        if kills <= 0:
+            return None
+        return int(self.projection.rate('firemaking_xp') / kills)
+
+    # Average xp per kill, recent when known
     def average(self):
+        recent = self.recent_average()
+        if recent is not None and recent > 0:
+            return recent
         return self.firemaking_xp // self.kc_wintertodt
 
     # Estimated kills until level up
     def kills_to_level_up(self):
-        remaining = (level_to_xp(self.firemaking_level + 1)) - self.firemaking_xp
+        remaining = xp_to_next(self.firemaking_xp)
         return remaining // self.average()
 
     # Estimated kills remaining until level 99
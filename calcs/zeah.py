@@ -1,6 +1,7 @@
 # Zeah runecrafting calculator (bloods and souls)
 
-from calcs.experience import level_to_xp, xp_to_level, LEVEL_99
+from calcs.experience import xp_to_next, LEVEL_99
+from calcs.projection import projection_cache
 from helpers.hiscore import Hiscore
 
 # TODO Make sure to account for new bonus with kourend elites done
@@ -13,12 +14,18 @@ RUNES_PER_TRIP = 204
 class Zeah(Hiscore):
     """ Calculator for blood and soul runes """
 
+    def __init__(self, username):
+        super().__init__(username)
+        self.projection = None
+
+    async def fetch(self):
+        """ Fetch the results, and the recent runecraft rate when enough history is stored """
+        await super().fetch()
+        self.projection = await projection_cache.get(self.username)
+
     def xp_needed_to_level_up(self):
         """ Returns xp needed to level up """
-        if self.runecraft_xp == 200000000:
-            return 0
-        virtual_level = xp_to_level(self.runecraft_xp)
-        return level_to_xp(virtual_level + 1) - self.runecraft_xp
+        return xp_to_next(self.runecraft_xp)
 
     def bloods_to_level_up(self):
         """ Returns number of blood runes needed to level up """
@@ -1,15 +1,23 @@
+import asyncio
+
 import discord
 from discord.ext import commands
 
 from calcs.agility import Agility
 from calcs.alchemy import Alchemy
+from calcs.alchprofit import alch_profit
+from calcs.dry import Dry
 from calcs.experience import next_level_string
+from calcs.loot import Loot
 from calcs.tasks import Tasks
 from calcs.wines import Wines
 from calcs.wintertodt import Wintertodt
 from calcs.zeah import Zeah
 from helpers.urls import get_icon_url
-from helpers.ge import GrandExchange, nice_price
+from helpers.ge import nice_price
+from helpers.hiscore import Hiscore, UserNotFound
+from helpers.monsters import load_monster_from_api, monster_index
+from helpers.prices import fetch_prices
 
 
 class Calculators(commands.Cog):
@@ -40,6 +48,8 @@ class Calculators(commands.Cog):
         if user.slayer_level < 99:
             embed.add_field(name="Tasks to level 99", value=f'{user.tasks_to_level_99()}', inline=True)
             embed.add_field(name="Estimated total tasks", value=f'{user.estimated_total_tasks()}', inline=True)
+        if user.projection is not None:
+            embed.add_field(name="At your recent rate", value=user.projection.summary('slayer'), inline=True)
         embed.set_footer(text="This calculator is more accurate at higher slayer levels")
         await ctx.send(f'{ctx.message.author.mention}', embed=embed)
         return
@@ -75,10 +85,9 @@ class Calculators(commands.Cog):
         """ Blood and soul rune calculator """
         safe_username = ' '.join(username)
         user = Zeah(safe_username)
-        bloods = GrandExchange("Blood rune")
-        souls = GrandExchange("Soul rune")
         async with ctx.typing():
-            await user.fetch()
+            # Both prices are fetched alongside the hiscore in one round trip
+            _, (bloods, souls) = await asyncio.gather(user.fetch(), fetch_prices(["Blood rune", "Soul rune"]))
         embed = discord.Embed(title="Zeah runecrafting calculator",
                               description=f'**{user.runecraft_level}** Runecraft ({user.runecraft_xp:,} xp)'
                                           f' | {safe_username}')
@@ -88,44 +97,43 @@ class Calculators(commands.Cog):
             embed.add_field(name="Level too low",
                             value="You need a runecraft level of at least 77 to make blood runes", inline=True)
         elif user.runecraft_level < 90:
-            await bloods.fetch()
             embed.add_field(name="Bloods to level up",
                             value=f'{user.bloods_to_level_up() + 1:,.0f}\n'
-                                  f'~{nice_price(user.bloods_to_level_up() * bloods.current_price)}\n'
+                                  f'~{nice_price(user.bloods_to_level_up() * bloods.price)}\n'
                                   f'({user.blood_trips_to_level_up() + 1:,.0f} trips)',
                             inline=True)
             embed.add_field(name="Bloods to level 99",
                             value=f'{user.bloods_to_level_99() + 1:,.0f}\n'
-                                  f'~{nice_price(user.bloods_to_level_99() * bloods.current_price)}\n'
+                                  f'~{nice_price(user.bloods_to_level_99() * bloods.price)}\n'
                                   f'({user.blood_trips_to_level_99() + 1:,.0f} trips)',
                             inline=True)
-            footer += f'\nBlood rune price: {bloods.current_price} gp'
+            footer += f'\nBlood rune price: {bloods.price_text} gp'
         else:
-            await bloods.fetch()
-            await souls.fetch()
             embed.add_field(name="Bloods to level up",
                             value=f'{user.bloods_to_level_up() + 1:,.0f}\n'
-                                  f'~{nice_price(user.bloods_to_level_up() * bloods.current_price)}\n'
+                                  f'~{nice_price(user.bloods_to_level_up() * bloods.price)}\n'
                                   f'({user.blood_trips_to_level_up() + 1:,.0f} trips)',
                             inline=True)
             embed.add_field(name="Souls to level up",
                             value=f'{user.souls_to_level_up() + 1:,.0f}\n'
-                                  f'~{nice_price(user.souls_to_level_up() * souls.current_price)}\n'
+                                  f'~{nice_price(user.souls_to_level_up() * souls.price)}\n'
                                   f'({user.soul_trips_to_level_up() + 1:,.0f} trips)',
                             inline=True)
-            footer += f'\nBlood rune price: {bloods.current_price} gp\n' \
-                      f'Soul rune price: {souls.current_price} gp'
+            footer += f'\nBlood rune price: {bloods.price_text} gp\n' \
+                      f'Soul rune price: {souls.price_text} gp'
             if user.runecraft_level < 99:
                 embed.add_field(name="Bloods to level 99",
                                 value=f'{user.bloods_to_level_99() + 1:,.0f}\n'
-                                      f'~{nice_price(user.bloods_to_level_99() * bloods.current_price)}\n'
+                                      f'~{nice_price(user.bloods_to_level_99() * bloods.price)}\n'
                                       f'({user.blood_trips_to_level_99() + 1:,.0f} trips)',
                                 inline=True)
                 embed.add_field(name="Souls to level 99",
                                 value=f'{user.souls_to_level_99() + 1:,.0f}\n'
-                                      f'~{nice_price(user.souls_to_level_99() * souls.current_price)}\n'
+                                      f'~{nice_price(user.souls_to_level_99() * souls.price)}\n'
                                       f'({user.soul_trips_to_level_99() + 1:,.0f} trips)',
                                 inline=True)
+        if user.runecraft_level >= 77 and user.projection is not None:
+            embed.add_field(name="At your recent rate", value=user.projection.summary('runecraft'), inline=True)
         embed.set_footer(text=footer)
         await ctx.send(f'{ctx.message.author.mention}', embed=embed)
         return
@@ -177,10 +185,15 @@ class Calculators(commands.Cog):
             embed.add_field(name="Firemaking level", value=f'**{int(wt.firemaking_level):,}**', inline=True)
             embed.add_field(name="XP", value=f'{int(wt.firemaking_xp):,}', inline=True)
             embed.add_field(name="Wintertodt kill count", value=f'{int(wt.kc_wintertodt):,}')
-            embed.add_field(name="Average XP per kill", value=f'{wt.average():,} xp')
+            if wt.recent_average():
+                embed.add_field(name="Recent XP per kill", value=f'{wt.average():,} xp')
+            else:
+                embed.add_field(name="Average XP per kill", value=f'{wt.average():,} xp')
             embed.add_field(name="Kills to level up", value=f'{wt.kills_to_level_up():,.0f}')
             embed.add_field(name="Kills to level 99",
                             value=f'{wt.kills_to_level_99():,}\n(Estimated {wt.estimated_total_kills():,} total)')
+            if wt.projection is not None:
+                embed.add_field(name="At your recent rate", value=wt.projection.summary('firemaking'))
         embed.set_footer(text=f'{next_level_string(int(wt.firemaking_xp), "firemaking")}')
         await ctx.send(f'{ctx.message.author.mention}', embed=embed)
         return
@@ -217,6 +230,115 @@ class Calculators(commands.Cog):
         await ctx.send(f'{ctx.message.author.mention}', embed=embed)
         return
 
+    @commands.command(name='alchprofit',
+                      description='Most profitable items to high alch right now',
+                      aliases=['alchs', 'haprofit'],
+                      case_insensitive=True)
+    async def alch_profit_command(self, ctx):
+        """ Ranks items by high alch profit per hour """
+        async with ctx.typing():
+            ranking = await alch_profit.fetch()
+        if alch_profit.nature_price is None:
+            embed = discord.Embed(title="High alchemy profit",
+                                  description="GE prices haven't been crawled yet, try again in a few minutes.")
+            await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+            return
+        embed = discord.Embed(title="High alchemy profit",
+                              description=f'Nature rune cost: {alch_profit.nature_price:,} gp')
+        if len(ranking) == 0:
+            embed.add_field(name="No profitable items", value="Nothing can be alched for profit right now")
+        for (rank, item) in enumerate(ranking, 1):
+            embed.add_field(name=f'{rank}. {item["name"]}',
+                            value=f'**{item["profit"]:,}** gp per cast\n'
+                                  f'**{nice_price(item["profit_per_hr"])}** per hr\n'
+                                  f'Price {item["price"]:,} gp \u2022 Alch {item["highalch"]:,} gp\n'
+                                  f'{item["casts_per_hr"]:,} casts/hr (buy limit {item["buy_limit"] or "unknown"})',
+                            inline=True)
+        embed.set_footer(text=f'Buy limits reset every 4 hours\nTime calculated with 1200 alchs/hr')
+        await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+        return
+
+    @commands.command(name='loot',
+                      description='''Expected loot value of a monster
+        Add a kill rate at the end for gp per hour''',
+                      aliases=['gpkill'],
+                      case_insensitive=True)
+    async def loot_command(self, ctx, *monster):
+        """ Expected gp per kill (and per hour) of a monster """
+        kills_per_hr = None
+        if len(monster) > 1 and monster[-1].replace('.', '', 1).isdigit():
+            kills_per_hr = float(monster[-1])
+            monster = monster[:-1]
+        name = ' '.join(monster)
+        if len(name) < 3:
+            return await ctx.send("Sorry, invalid input. Minimum of 3 characters required.")
+        async with ctx.typing():
+            await monster_index.load()
+            monsters = load_monster_from_api(name)
+            if monsters is False:
+                return await ctx.send("Sorry, we could not find that monster.")
+            if len(monsters) > 1:
+                names = '\n'.join(f'`{index}` {m.name}' for (index, m) in enumerate(monsters[:10], 1))
+                return await ctx.send(f'There are multiple results for `{name}`, be more specific:\n{names}')
+            loot = Loot(monsters[0], kills_per_hr)
+            await loot.fetch()
+        embed = discord.Embed(title=f'{loot.monster.name} loot', url=loot.monster.wiki_url,
+                              description=f'**{nice_price(loot.per_kill)}** per kill')
+        if loot.kills_per_hr is not None:
+            embed.add_field(name="Per hour", value=f'**{nice_price(loot.per_hour())}** '
+                                                   f'at {loot.kills_per_hr:,.0f} kills/hr', inline=False)
+        if len(loot.top_drops) > 0:
+            embed.add_field(name="Most valuable drops (per kill)",
+                            value='\n'.join(f'`{drop}:` {nice_price(value)}' for (drop, value) in loot.top_drops),
+                            inline=False)
+        embed.set_footer(text='Rarity x quantity x GE price over the whole drop table')
+        await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+        return
+
+    @commands.command(name='dry',
+                      description='''How dry you are on a drop
+        Separate with commas: !b dry vorkath, draconic visage, 500
+        Leave the item empty for every unique, use a username instead of a kill count to use your boss kc''',
+                      aliases=['dryness'],
+                      case_insensitive=True)
+    async def dry_command(self, ctx, *arguments):
+        """ Chance of a drop (or a full log) by a kill count """
+        parts = [part.strip() for part in ' '.join(arguments).split(',')]
+        if len(parts) != 3 or len(parts[0]) < 3 or parts[2] == '':
+            return await ctx.send('Usage: `!b dry <monster>, <item>, <kc or username>`')
+        name, item, kc = parts
+        async with ctx.typing():
+            await monster_index.load()
+            monsters = load_monster_from_api(name)
+            if monsters is False:
+                return await ctx.send("Sorry, we could not find that monster.")
+            if len(monsters) > 1:
+                names = '\n'.join(f'`{index}` {m.name}' for (index, m) in enumerate(monsters[:10], 1))
+                return await ctx.send(f'There are multiple results for `{name}`, be more specific:\n{names}')
+            monster = monsters[0]
+            if not kc.isdigit():
+                user = Hiscore(kc)
+                await user.fetch()
+                kcs = {boss.lower(): score for (boss, score, _) in user.kcs}
+                if monster.name.lower() not in kcs:
+                    raise UserNotFound(f'The hiscores have no {monster.name} kill count')
+                kc = max(kcs[monster.name.lower()], 0)
+            dry = Dry(monster, item, int(kc))
+            await dry.fetch()
+        what = dry.drops[0] if len(dry.drops) == 1 else f'all {len(dry.drops)} uniques'
+        embed = discord.Embed(title=f'{monster.name} dry calculator',
+                              description=f'Chance of {what} by **{dry.kc:,}** kc')
+        embed.add_field(name="Chance", value=f'**{dry.chance:.2%}** (closed form)\n'
+                                             f'{dry.simulated_chance:.2%} (simulated)', inline=True)
+        embed.add_field(name="Kills needed", value=f'Median: {dry.median:,}\n'
+                                                   f'90% of players: {dry.kc_90:,}\n'
+                                                   f'99% of players: {dry.kc_99:,}', inline=True)
+        if dry.chance > 0.5:
+            embed.add_field(name="Verdict", value=f'Drier than {dry.chance:.0%} of players', inline=False)
+        embed.set_footer(text=f'{dry.trials:,} simulated accounts \u2022 drop rates from osrsbox')
+        await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+        return
+
 
 # Cog setup
 def setup(bot):
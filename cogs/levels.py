@@ -3,6 +3,7 @@ from discord.ext import commands
 
 from calcs.combat import Combat
 from calcs.experience import next_level_string
+from calcs.pets import Pets
 from helpers.hiscore import Hiscore
 from helpers.tracker import Tracker
 from helpers.urls import get_icon_url, hiscore_url
@@ -553,6 +554,28 @@ class Levels(commands.Cog, command_attrs=dict(hidden=True)):
         await ctx.send(embed=embed)
         return
 
+    @commands.command(name='pets',
+                      description='Pet chances from a user\'s boss kill counts',
+                      aliases=['pet'],
+                      hidden=False,
+                      case_insensitive=True)
+    async def pet_lookup(self, ctx, *username):
+        """ Chance of each boss pet by now, likeliest first """
+        url_safe_name = '+'.join(username)
+        safe_name = ' '.join(username)
+        user = Pets(url_safe_name)
+        async with ctx.typing():
+            await user.fetch()
+        embed = discord.Embed(title="Pet chances", description=f'{safe_name}')
+        table = user.generate_pet_table()
+        if table:
+            embed.add_field(name=f'{user.expected_pets():.2f} pets expected', value=f'```{table}```')
+            embed.set_footer(text='Missing the pets at the top of the list is the unluckiest')
+        else:
+            embed.add_field(name='Nothing found', value='No boss kill counts with pets on the hiscore page.')
+        await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+        return
+
     @commands.command(name="99s",
                       description='Shows all level 99s for a user',
                       aliases=['99', 'max'],
@@ -575,11 +598,10 @@ class Levels(commands.Cog, command_attrs=dict(hidden=True)):
         return
 
     @commands.command(name='xp',
-                      description='XP tracker using Crystal Math Labs\n'
-                                  'This command can be really slow because it needs to update your XP\n'
+                      description='XP tracker using the hiscore lookups the bot has stored\n'
                                   'Use `mxp` alias to see monthly activity.\n'
                                   'Use `yxp` alias to see yearly activity.\n'
-                                  'XP is only updated when checking weekly activity.',
+                                  'Every lookup of your stats is a new data point.',
                       aliases=['mxp', 'yxp'],
                       hidden=False,
                       case_insensitive=True)
@@ -592,34 +614,29 @@ class Levels(commands.Cog, command_attrs=dict(hidden=True)):
         time = '7d'
         skills = 5
         title = 'Weekly activity'
-        update = True
-        if ctx.invoked_with == 'xp':
-            await ctx.send(f'Updating XP for **{safe_name}**...')
         if ctx.invoked_with == 'mxp':
             time = '30d'
             title = 'Monthly activity'
             skills = 10
-            update = False
         elif ctx.invoked_with == 'yxp':
             time = '365d'
             title = 'Yearly activity'
             skills = 15
-            update = False
         async with ctx.typing():
-            await tracker.fetch(time=time, update=update)
+            await tracker.fetch(time=time)
         embed = discord.Embed(title=title, url=tracker.url)
         embed.set_thumbnail(url=tracker.logo)
         # Overall stats
         (overall_name, overall_xp, overall_rank, overall_lvl) = tracker.stats[0]
         embed.add_field(name=f'{safe_name}',
                         value=f'**{int(overall_xp):,}** XP\n'
-                              f'**{int(tracker.get_non_virtual_lvl("Overall")):,}** Total\n'
+                              f'**{tracker.total_level:,}** Total\n'
                               f'**{int(overall_rank):,}** Rank')
         # Overall gains
-        (overall_name, overall_xp, overall_rank, overall_levels, overall_ehp) = tracker.top_gains[0]
+        (overall_name, overall_xp, overall_rank, overall_levels) = tracker.top_gains[0]
         embed.add_field(name='Overall gains', value=f'+{overall_xp:,} XP\n'
                                                     f'{overall_levels} levels\n'
-                                                    f'{overall_rank} overall rank')
+                                                    f'{overall_rank:+,} overall rank')
         # Top 5 gains
         embed.add_field(name=f'Top {skills} gains', value=f'```{tracker.generate_table(skills=skills)}```', inline=False)
         # Boss kills
@@ -1,6 +1,5 @@
 import logging
 import asyncio
-import requests
 from datetime import datetime
 from bs4 import BeautifulSoup
 
@@ -8,11 +7,19 @@ import discord
 import pytz
 from discord.ext import commands
 
+from helpers import http
 from helpers.ge import GrandExchange
-from helpers.monsters import load_monster_from_api, parse_monster_drops
+from helpers.monsters import load_monster_from_api, rarest_drops, monster_index
 from helpers.news import News
+from helpers.price_history import WINDOWS, DEFAULT_WINDOW
+from helpers.prices import fetch_prices
 from helpers.urls import hiscore_url, wiki_url, ge_url, rsbuddy_url, members_icon, news_icon
 
+# Discord caps an embed field at 1024 characters, and a whole embed at 6000
+FIELD_LIMIT = 1024
+MAX_PRICE_FIELDS = 5
+MORE_ROOM = 32
+
 
 class Links(commands.Cog):
     """ Link commands to return URLs of common stuff """
@@ -34,7 +41,8 @@ class Links(commands.Cog):
         time = datetime.now()
         timezone = pytz.timezone("America/Los_Angeles")
         pst_time = timezone.localize(time)
-        soup = BeautifulSoup(requests.get(url).content, 'html.parser')  # TODO async this
+        response = await http.get(url)
+        soup = BeautifulSoup(response.content, 'html.parser')
         embed = discord.Embed(timestamp=pst_time)
         try:
             description = soup.find(property="og:description")["content"]
@@ -61,14 +69,22 @@ class Links(commands.Cog):
         return await ctx.send(embed=embed)
 
     @commands.command(name='price',
-                      description='Use to lookup items on the Grand Exchange',
+                      description='''Use to lookup items on the Grand Exchange
+        Add 7d, 30d, 90d, 1y or all after the item for a different graph window''',
                       aliases=['-g', 'ge'],
                       case_insensitive=True)
     async def ge_command(self, ctx, *search_description):
         """ Responds with information about an item from the Grand Exchange """
         safe_name = ' '.join(search_description).lower()
+        if ',' in safe_name:
+            return await self.prices(ctx, [name for name in safe_name.split(',') if name.strip() != ''])
+        # An optional graph window can follow the item name, !b price dragon bones 1y
+        window = DEFAULT_WINDOW
+        if len(search_description) > 1 and search_description[-1].lower() in WINDOWS:
+            window = search_description[-1].lower()
+            safe_name = ' '.join(search_description[:-1]).lower()
         url_safe_name = safe_name.replace(' ', '+')
-        ge = GrandExchange(safe_name)
+        ge = GrandExchange(safe_name, window)
         async with ctx.typing():
             await ge.fetch()
         time = datetime.now()
@@ -97,7 +113,10 @@ class Links(commands.Cog):
                 async with ctx.typing():
                     await ctx.invoke(self.ge_command, name)
         else:
-            embed = discord.Embed(title=ge.name, description=ge.description, url=f'{ge_url}{url_safe_name}',
+            description = ge.description
+            if ge.closest_match:
+                description = f'Closest match for `{safe_name}`\n{description}'
+            embed = discord.Embed(title=ge.name, description=description, url=f'{ge_url}{url_safe_name}',
                                   timestamp=pst_time)
             if ge.todays_price_trend == 'positive':
                 embed.color = discord.Colour.dark_green()
@@ -110,19 +129,54 @@ class Links(commands.Cog):
             embed.add_field(name="Change", value=f'**{ge.day30_change}** over the last month\n'
                                                  f'**{ge.day90_change}** over the last 3 months\n'
                                                  f'**{ge.day180_change}** over the last 6 months')
+            if ge.window_change:
+                embed.add_field(name=f'Change ({window})', value=f'**{ge.window_change}**')
             other_info = f'High alch: {ge.high_alch} gp \u2022 {ge.buy_limit} buy limit'
             if ge.is_members:
                 embed.set_footer(text=f'{other_info}\nMembers item', icon_url=members_icon)
             else:
                 embed.set_footer(text=f'{other_info}\nNon members item')
             # Graph
-            ge.generate_graph()
-            file = discord.File('assets/graph.png', filename='graph.png')
+            graph = await ge.generate_graph()
+            if graph is None:
+                return await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+            file = discord.File(graph, filename='graph.png')
             embed.set_image(url='attachment://graph.png')
             await ctx.send(f'{ctx.message.author.mention}', embed=embed, file=file)
             file.close()
             return
 
+    async def prices(self, ctx, names):
+        """ Responds with just the current price of several items, looked up together """
+        if len(names) == 0:
+            return await ctx.send('Usage: `!b price <item>, <item>, ...`')
+        async with ctx.typing():
+            item_prices = await fetch_prices(names)
+        embed = discord.Embed(title="Grand Exchange", description=f'Prices for {len(item_prices)} items')
+        lines = []
+        for item in item_prices:
+            if not item.found:
+                lines.append(f'`{item.query.strip()}` - *no single match found*')
+                continue
+            line = f'**{item.name}** - {item.price_text} gp ({item.todays_change} today)'
+            if item.closest_match:
+                line += f' *closest match for* `{item.query.strip()}`'
+            lines.append(line)
+        # Split over as many fields as needed, the last one keeps room to count what didn't fit
+        fields = ['']
+        for (index, line) in enumerate(lines):
+            line = line[:FIELD_LIMIT - MORE_ROOM] + '\n'
+            limit = FIELD_LIMIT - MORE_ROOM if len(fields) == MAX_PRICE_FIELDS else FIELD_LIMIT
+            if len(fields[-1]) + len(line) > limit:
+                if len(fields) == MAX_PRICE_FIELDS:
+                    fields[-1] += f'\u2026 and {len(lines) - index} more'
+                    break
+                fields.append('')
+            fields[-1] += line
+        for (index, value) in enumerate(fields):
+            embed.add_field(name="Prices" if index == 0 else "\u200b", value=value, inline=False)
+        await ctx.send(f'{ctx.message.author.mention}', embed=embed)
+
     @commands.command(name='rsbuddy',
                       description='Returns a URL to the RSBuddy page for an item',
                       aliases=['-rsb'],
@@ -159,6 +213,7 @@ class Links(commands.Cog):
         monster = " ".join(monster)
         if len(list(monster)) < 3:
             return await ctx.send("Sorry, invalid input. Minimum of 3 characters required.")
+        await monster_index.load()
         loaded_monster = load_monster_from_api(monster.lower())
         if loaded_monster is not False:
             if len(loaded_monster) == 1:
@@ -175,9 +230,9 @@ class Links(commands.Cog):
                 embed.add_field(name="Examine", value=loaded_monster.examine, inline=True)
                 embed.add_field(name="Detailed", value=stats, inline=False)
                 embed.set_footer(text=f"Released: {loaded_monster.release_date}")
-                loaded_monster_drops = parse_monster_drops(loaded_monster.drops)
+                loaded_monster_drops = rarest_drops(loaded_monster)
                 if len(loaded_monster_drops) > 0:
-                    drops = [f"`{drop['name']}:` {drop['rarity_string']}" for drop in loaded_monster_drops[:5]]
+                    drops = [f"`{name}:` {rarity}" for (name, rarity, _) in loaded_monster_drops]
                     embed.add_field(name="Rarest drops", value="\n".join(drops))
                 return await ctx.send(embed=embed)
             else:
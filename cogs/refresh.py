@@ -4,6 +4,14 @@ import logging
 import discord
 from discord.ext import commands, tasks
 
+from calcs.alchprofit import alch_profit
+from helpers import http
+from helpers.ge import GEUnavailable
+from helpers.prefetch import prefetcher, TooManyRegistered
+from helpers.price_history import price_history
+from helpers.price_table import price_table
+from helpers.snapshots import snapshot_store
+
 
 class Refresh(commands.Cog):
     """ Tasks to be periodically performed """
@@ -11,6 +19,20 @@ class Refresh(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.refresh_presence.start()
+        self.crawl_prices.start()
+        self.crawl_histories.start()
+        self.compact_histories.start()
+        self.compact_snapshots.start()
+        self.prefetch_hiscores.start()
+
+    def cog_unload(self):
+        """ Stops the tasks so a reload doesn't run them twice """
+        self.refresh_presence.cancel()
+        self.crawl_prices.cancel()
+        self.crawl_histories.cancel()
+        self.compact_histories.cancel()
+        self.compact_snapshots.cancel()
+        self.prefetch_hiscores.cancel()
 
     @tasks.loop(minutes=30.0)
     async def refresh_presence(self):
@@ -19,6 +41,130 @@ class Refresh(commands.Cog):
         status = discord.Activity(name='for !b help', type=3)
         return await self.bot.change_presence(activity=status)
 
+    @tasks.loop(minutes=1.0)
+    async def crawl_prices(self):
+        """ Refreshes the next batch of the local GE price table """
+        try:
+            await price_table.crawl()
+            # Rank alch profits now, so the command is just a lookup
+            await alch_profit.refresh()
+        except GEUnavailable as error:
+            logging.info(f'Price crawl skipped: {error}')
+        except Exception:
+            # Keep the loop alive, the next tick retries
+            logging.exception('Price crawl failed')
+
+    @tasks.loop(hours=1.0)
+    async def crawl_histories(self):
+        """ Fetches the graphs of items whose price history hasn't been extended in a week """
+        try:
+            await price_table.crawl_histories()
+        except GEUnavailable as error:
+            logging.info(f'History crawl skipped: {error}')
+        except Exception:
+            logging.exception('History crawl failed')
+
+    @tasks.loop(hours=24.0)
+    async def compact_histories(self):
+        """ Rewrites the GE price histories sorted and without duplicate or partial points """
+        try:
+            await price_history.compact_stored()
+        except Exception:
+            logging.exception('History compaction failed')
+
+    @tasks.loop(hours=1.0)
+    async def compact_snapshots(self):
+        """ Thins out the stored hiscore snapshots of players not compacted in the last day """
+        try:
+            await snapshot_store.compact()
+        except Exception:
+            logging.exception('Snapshot compaction failed')
+
+    @tasks.loop(minutes=1.0)
+    async def prefetch_hiscores(self):
+        """ Refreshes the hiscores of registered and frequently looked up players before they expire """
+        try:
+            await prefetcher.refresh()
+        except Exception:
+            logging.exception('Hiscore prefetch failed')
+
+    @commands.command(name='register',
+                      description='Keeps a player\'s hiscores ready so lookups for them are instant',
+                      aliases=[],
+                      case_insensitive=True)
+    @commands.guild_only()
+    async def register_command(self, ctx, *username):
+        """ Registers a player in this server for hiscore prefetching """
+        safe_name = ' '.join(username)
+        if safe_name == '':
+            await ctx.send('You need to enter a username after the command')
+            return
+        try:
+            added = prefetcher.register(ctx.guild.id, safe_name)
+        except TooManyRegistered as e:
+            await ctx.send(f'{e}')
+            return
+        if added:
+            await ctx.send(f'Registered **{safe_name}**, their hiscores will be kept up to date.')
+        else:
+            await ctx.send(f'**{safe_name}** is already registered in this server.')
+        return
+
+    @commands.command(name='unregister',
+                      description='Stops keeping a registered player\'s hiscores ready',
+                      aliases=[],
+                      case_insensitive=True)
+    @commands.guild_only()
+    async def unregister_command(self, ctx, *username):
+        """ Removes a player registered in this server """
+        safe_name = ' '.join(username)
+        if prefetcher.unregister(ctx.guild.id, safe_name):
+            await ctx.send(f'Unregistered **{safe_name}**.')
+        else:
+            await ctx.send(f'**{safe_name}** isn\'t registered in this server.')
+        return
+
+    @commands.command(name='prefetch',
+                      description='Hiscore prefetch status, the owner can set the budget per minute',
+                      aliases=[],
+                      hidden=True,
+                      case_insensitive=True)
+    async def prefetch_command(self, ctx, budget: int = None):
+        """ Shows the prefetcher's hit rate and budget use """
+        if budget is not None and await self.bot.is_owner(ctx.author):
+            prefetcher.budget = max(budget, 0)
+        embed = discord.Embed(title="Hiscore prefetch")
+        for (name, value) in prefetcher.status().items():
+            embed.add_field(name=name.capitalize(), value=f'{value}')
+        await ctx.send(embed=embed)
+        return
+
+    @commands.command(name='upstreams',
+                      description='Concurrency limits and circuit breakers of the upstream hosts',
+                      aliases=['circuits'],
+                      hidden=True,
+                      case_insensitive=True)
+    async def upstreams_command(self, ctx):
+        """ Shows the state of every upstream host's limiter """
+        embed = discord.Embed(title="Upstreams")
+        for (host, status) in http.status().items():
+            embed.add_field(name=host, value=status, inline=False)
+        await ctx.send(embed=embed)
+        return
+
+    @commands.command(name='pricetable',
+                      description='Price crawler status',
+                      aliases=['crawler'],
+                      hidden=True,
+                      case_insensitive=True)
+    async def price_table_command(self, ctx):
+        """ Shows the progress and staleness of the price crawler """
+        embed = discord.Embed(title="Price table", description=f'Version {price_table.version}')
+        for (name, value) in price_table.status().items():
+            embed.add_field(name=name.capitalize(), value=f'{value}')
+        await ctx.send(embed=embed)
+        return
+
 
 # Cog setup
 def setup(bot):
@@ -0,0 +1,103 @@
+# Caching helpers shared by the upstream fetchers
+
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+# Frequency sketch settings
+SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+SKETCH_CANDIDATES = 1000
+
+# Fetch times (epoch seconds) of the stale data served while handling the current command.
+# The bot sets a new list per message, the command's embed footer then says how old the data is
+served_stale = contextvars.ContextVar('served_stale', default=None)
+
+
+def note_stale(fetched):
+    """ Records that data fetched at fetched was served past its TTL for the current command """
+    stale = served_stale.get()
+    if stale is not None:
+        stale.append(fetched)
+
+
+def revalidate(flights, key, load):
+    """ Refreshes a stale entry in the background unless a load is already running.
+    A failure is only logged, the stale entry keeps being served """
+    if flights.in_flight(key):
+        return
+    task = asyncio.ensure_future(flights.run(key, load))
+    task.add_done_callback(log_revalidation)
+
+
+def log_revalidation(task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f'Background refresh failed: {task.exception()!r}')
+
+
+class SingleFlight:
+    """ Coalesces concurrent loads of the same key into one in flight task """
+
+    def __init__(self):
+        self.pending = {}
+
+    def in_flight(self, key):
+        """ Returns True if a load for the key is running """
+        return key in self.pending
+
+    async def run(self, key, load):
+        """ Awaits the running load for key, or starts load() if there isn't one """
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self.pending[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # Shielded so a cancelled caller doesn't cancel the load for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.pending.get(key) is task:
+            del self.pending[key]
+
+
+class FrequencySketch:
+    """ Approximate counts of how often each key is added, in a fixed size count-min sketch.
+    Counts fade when decay() is called, the owner calls it on a timer.
+    The most recently added keys are remembered as candidates for the most frequent ones """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, candidates=SKETCH_CANDIDATES):
+        self.width = width
+        self.max_candidates = candidates
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.rows = np.arange(depth)
+        self.candidates = OrderedDict()
+
+    def columns(self, key):
+        """ One counter per row, from independent hashes of the key """
+        return np.array([hash((row, key)) % self.width for row in range(len(self.rows))])
+
+    def add(self, key):
+        self.table[self.rows, self.columns(key)] += 1
+        self.candidates[key] = None
+        self.candidates.move_to_end(key)
+        if len(self.candidates) > self.max_candidates:
+            self.candidates.popitem(last=False)
+
+    def decay(self):
+        """ Halves every count, candidates that fall to 0 are forgotten """
+        self.table >>= 1
+        for key in [key for key in self.candidates if self.estimate(key) == 0]:
+            del self.candidates[key]
+
+    def estimate(self, key):
+        """ Decayed count of key, never lower than the real one """
+        return int(self.table[self.rows, self.columns(key)].min())
+
+    def top(self, count, minimum=1):
+        """ Returns up to count (key, estimate) of the candidates seen at least minimum times, most frequent first """
+        estimates = [(key, self.estimate(key)) for key in self.candidates]
+        estimates = [(key, estimate) for (key, estimate) in estimates if estimate >= minimum]
+        return sorted(estimates, key=lambda estimate: estimate[1], reverse=True)[:count]
@@ -1,13 +1,32 @@
 # Used to pull API data from the GE page
 
 import asyncio
-import json
-import matplotlib.pyplot as plotter
-import requests
-from osrsbox import items_api
+import time
 
+from helpers import http
+from helpers.cache import SingleFlight, note_stale, revalidate
+from helpers.graphs import graph_renderer
+from helpers.item_index import item_index, CONFIDENT, EXACT, LIKELY
+from helpers.itemdb import item_db
+from helpers.price_history import price_history, moving_average, DAY_MS, DEFAULT_WINDOW
 from helpers.urls import ge_api_item_url, ge_graph_url, ge_query_url
 
+# Cache settings (seconds)
+# The GE publishes new guide prices about once a day
+GE_UPDATE_INTERVAL = 24 * 60 * 60
+# How often an item is rechecked once its next update is due
+GE_RECHECK = 15 * 60
+# Price only lookups don't carry a data point, so they are rechecked this often
+DETAIL_TTL = 60 * 60
+# Past those, prices checked up to STALE_TTL ago are served straight away and refreshed in the background,
+# older ones are refetched first. While the GE is down they're served up to HARD_TTL old
+GE_STALE_TTL = 60 * 60
+GE_HARD_TTL = 2 * GE_UPDATE_INTERVAL
+MAX_CACHED_ITEMS = 2000
+
+# GE abbreviations for large prices, "12.5k"
+PRICE_SUFFIXES = {'k': 1000, 'm': 1000000, 'b': 1000000000}
+
 
 def nice_price(price):
     """ Returns the price in nice numbers with k/m/b on the end as a string """
@@ -21,14 +40,159 @@ def nice_price(price):
         return f'{price / 1000000000:,.2f} B gp'
 
 
+def parse_price(price):
+    """ Converts a GE price or change (1234, "1,234", "12.5k" or "- 1.2m") to an int """
+    if isinstance(price, int):
+        return price
+    price = price.replace(',', '').replace(' ', '').lower()
+    if price[-1:] in PRICE_SUFFIXES:
+        return round(float(price[:-1]) * PRICE_SUFFIXES[price[-1]])
+    return int(float(price))
+
+
+def is_rounded(price):
+    """ True if a GE catalogue price was rounded to a k, m or b suffix (12.5k) """
+    return isinstance(price, str) and price.strip().lower()[-1:] in PRICE_SUFFIXES
+
+
+def latest_price(graph):
+    """ Returns the exact price of an item's latest daily graph point, or None if the graph is empty """
+    daily = graph.get('daily') or {}
+    if not daily:
+        return None
+    return int(daily[max(daily, key=int)])
+
+
+async def ge_get(url):
+    """ GETs a GE api url, failing fast with GEUnavailable while the GE is down """
+    try:
+        return await http.get(url)
+    except http.CircuitOpen as error:
+        raise GEUnavailable(f'The Grand Exchange is unavailable at this time, '
+                            f'try again in {error.retry_after:.0f} seconds.') from error
+
+
+class PriceCache:
+    """ Caches detail and graph payloads by item id until the GE publishes new prices.
+    The latest graph data point seen for any item marks the current GE update, every older entry is stale """
+
+    def __init__(self, max_items=MAX_CACHED_ITEMS):
+        self.max_items = max_items
+        # item id -> (latest data point in ms, epoch time checked, detail, graph)
+        self.entries = {}
+        # item id -> (latest update when fetched, epoch time checked, detail) for price only lookups
+        self.details = {}
+        self.latest_update = 0
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def fresh(self, entry):
+        """ True if no newer GE update has been seen and the next one isn't due yet """
+        data_point, checked, _, _ = entry
+        if data_point < self.latest_update:
+            return False
+        due = data_point / 1000 + GE_UPDATE_INTERVAL
+        return time.time() < due or time.time() - checked < GE_RECHECK
+
+    async def serve(self, flight, load, entry, value):
+        """ Serves a cached value past its TTL: straight away while it's recent (refreshing it in the background),
+        else after trying to load it again, falling back to it while the GE is down """
+        age = time.time() - entry[1] if entry is not None else None
+        if age is not None and age < GE_STALE_TTL:
+            self.stale_hits += 1
+            revalidate(self.flights, flight, load)
+            note_stale(entry[1])
+            return value
+        self.misses += 1
+        try:
+            return await self.flights.run(flight, load)
+        except (GEUnavailable, *http.UPSTREAM_ERRORS):
+            if age is None or age >= GE_HARD_TTL:
+                raise
+            self.stale_hits += 1
+            note_stale(entry[1])
+            return value
+
+    async def get(self, item_id):
+        """ Returns (detail, graph) json for an item id, or None if the GE doesn't know it """
+        key = str(item_id)
+        entry = self.entries.get(key)
+        if entry is not None and self.fresh(entry):
+            self.hits += 1
+            return entry[2], entry[3]
+        value = (entry[2], entry[3]) if entry is not None else None
+        return await self.serve(key, lambda: self.load(key), entry, value)
+
+    async def get_detail(self, item_id):
+        """ Returns just the detail json for an item id (price only, no graph), or None if the GE doesn't know it """
+        key = str(item_id)
+        entry = self.entries.get(key)
+        if entry is not None and self.fresh(entry):
+            self.hits += 1
+            return entry[2]
+        entry = self.details.get(key)
+        if entry is not None and entry[0] >= self.latest_update and time.time() - entry[1] < DETAIL_TTL:
+            self.hits += 1
+            return entry[2]
+        # Fall back to whichever was checked last
+        full = self.entries.get(key)
+        if full is not None and (entry is None or full[1] > entry[1]):
+            entry = full
+        value = entry[2] if entry is not None else None
+        return await self.serve(('detail', key), lambda: self.load_detail(key), entry, value)
+
+    async def load_detail(self, key):
+        """ Fetches only the detail json for an item and caches it """
+        response = await ge_get(ge_api_item_url + key)
+        if response.status_code == 404:
+            return None
+        detail = response.json()
+        self.details.pop(key, None)
+        self.details[key] = (self.latest_update, time.time(), detail)
+        while len(self.details) > self.max_items:
+            del self.details[next(iter(self.details))]
+        return detail
+
+    async def load(self, key):
+        """ Fetches detail and graph for an item together and caches them """
+        response, graph_response = await asyncio.gather(ge_get(ge_api_item_url + key),
+                                                        ge_get(f'{ge_graph_url}{key}.json'))
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200 or graph_response.status_code not in (200, 404):
+            raise GEUnavailable('The Grand Exchange is unavailable at this time, try again later.')
+        detail = response.json()
+        if graph_response.status_code == 404:
+            # No graph published for the item (yet), it has no price history
+            graph = {'daily': {}, 'average': {}}
+        else:
+            try:
+                graph = graph_response.json()
+            except ValueError as error:
+                raise GEUnavailable('The Grand Exchange is unavailable at this time, try again later.') from error
+        data_point = max(map(int, graph['daily']), default=0)
+        if data_point > self.latest_update:
+            self.latest_update = data_point
+        await price_history.record(key, graph['daily'])
+        self.entries.pop(key, None)
+        self.entries[key] = (data_point, time.time(), detail, graph)
+        while len(self.entries) > self.max_items:
+            del self.entries[next(iter(self.entries))]
+        return detail, graph
+
+
 class GrandExchange:
     """ Pulls API data from the GE website """
 
-    def __init__(self, query):
+    def __init__(self, query, window=DEFAULT_WINDOW):
         # Check if query was entered
         self.query = query
         if query == '':
             raise MissingQuery("You must enter a search term after the command")
+        # Graph window, one of price_history.WINDOWS
+        self.window = window
 
         # This boolean is flipped if there is a lot of results from query
         self.multiple_results = False
@@ -36,6 +200,8 @@ class GrandExchange:
         # Fields
         self.matches = []
         self.item_id = ''
+        # Name of the item a misspelt or partial query was resolved to
+        self.closest_match = None
         self.graph_data = None
         self.icon = None
         self.id = None
@@ -52,44 +218,56 @@ class GrandExchange:
         self.day90_change = None
         self.day180_trend = None
         self.day180_change = None
+        self.window_change = None
         self.buy_limit = 'N/A'
         self.high_alch = 'N/A'
 
-    def generate_graph(self):
-        """ Generates a graph of daily price data """
-        # Gather data
-        prices = []
-        average = []
-        for data in self.graph_data['daily']:
-            prices.append(self.graph_data['daily'][data])
-        for data in self.graph_data['average']:
-            average.append(self.graph_data['average'][data])
-        plotter.rcParams['ytick.color'] = 'lightslategrey'
-        plotter.rcParams['figure.figsize'] = 8, 3
-        plotter.box(on=None)
-        # Axis labels
+    async def generate_graph(self):
+        """ Returns a BytesIO PNG graph of daily price data, rendered off the event loop.
+        The default window is the GE's own 180 days, other windows come from the stored price history.
+        Graphs are cached per item and window until the GE publishes a new data point.
+        Returns None when the item has no price points to draw """
+        key = (self.id, max(self.graph_data['daily'], key=int, default=0), self.window)
+        graph = graph_renderer.cached(key)
+        if graph is not None:
+            return graph
+        # Gather data, only other windows need the stored history
+        timestamps, prices = [], []
+        if self.window != DEFAULT_WINDOW:
+            timestamps, prices = await price_history.read(self.id, self.window)
+        if self.window == DEFAULT_WINDOW or len(prices) < 2:
+            if not self.graph_data['daily']:
+                return None
+            prices = list(self.graph_data['daily'].values())
+            average = list(self.graph_data['average'].values())
+            title = 'Past 180 days'
+        else:
+            average = moving_average(prices).tolist()
+            title = f'Past {(timestamps[-1] - timestamps[0]) // DAY_MS + 1} days'
+            prices = prices.tolist()
         high = max(prices)
-        mid = sum(prices)/len(prices)
+        mid = sum(prices) / len(prices)
         low = min(prices)
-        plotter.yticks([high, mid, low], [nice_price(high), nice_price(mid), nice_price(low)])
-        plotter.xticks([])
-        # Average line
-        plotter.axhline(y=mid, dashes=[1, 3])
-        # Title, plot, and save
-        plotter.title('Past 180 days', loc='right', color='lightslategrey')
-        plotter.plot(average, color="red")
-        plotter.plot(prices, color="lightslategrey")
-        plotter.savefig('assets/graph.png', transparent=True)
-        plotter.close()
+        labels = [nice_price(high), nice_price(mid), nice_price(low)]
+        return await graph_renderer.render(key, prices, average, labels, title)
 
-    async def fetch(self):
-        """ Fetch the data from the GrandExchange """
-        # Event loop
-        loop = asyncio.get_event_loop()
-        # Find item ID
+    async def find_item_id(self):
+        """ Resolves the query to an item id, sets item_id or flags multiple_results.
+        Exact and unambiguous names, aliases and confident fuzzy matches are resolved locally,
+        anything else falls back to a GE search """
+        await item_index.load()
+        candidates = item_index.search(self.query)
+        if len(candidates) == 1 or (len(candidates) > 0 and candidates[0][2] == EXACT):
+            self.item_id = str(candidates[0][0])
+            return
+        closest = item_index.fuzzy(self.query)
+        if closest and closest[2] >= CONFIDENT:
+            self.item_id = str(closest[0])
+            if closest[1].lower() != self.query.lower():
+                self.closest_match = closest[1]
+            return
         url = ge_query_url(self.query)
-        match_req = loop.run_in_executor(None, requests.get, url)
-        match_response = await match_req
+        match_response = await ge_get(url)
         match_data = match_response.json()
         for item in match_data['items']:
             if self.query.lower() in item['name'].lower():
@@ -98,30 +276,31 @@ class GrandExchange:
             self.item_id = str(self.matches[0]['id'])
         elif len(self.matches) > 0 and self.matches[0]['name'].lower() == self.query.lower():
             self.item_id = str(self.matches[0]['id'])
-        elif len(self.matches) == 0:
-            # Search JSON file
-            file = open('assets/item_ids.json')
-            id_list = json.load(file)
-            for i in id_list:
-                if self.query.lower() in i['name'].lower():
-                    self.item_id = str(i['id'])
-                    break
-            file.close()
+        elif len(self.matches) == 0 and len(candidates) > 0:
+            # Nothing on the GE's first page, use the best local match
+            self.item_id = str(candidates[0][0])
+        elif len(self.matches) == 0 and closest and closest[2] >= LIKELY:
+            # A typo the GE search can't handle, go with the closest name even if it isn't certain
+            self.item_id = str(closest[0])
+            self.closest_match = closest[1]
+        elif len(self.matches) == 0 and closest:
+            raise NoResults(f'No results for {self.query} found, did you mean {closest[1]}?')
         else:
             self.multiple_results = True
-            return
 
-        # Price info
-        req = loop.run_in_executor(None, requests.get, ge_api_item_url + self.item_id)
-        # Graph data
-        graph_req = loop.run_in_executor(None, requests.get, f'{ge_graph_url}{self.item_id}.json')
-        # Responses
-        response = await req
-        graph_response = await graph_req
-        if response.status_code == 404:
+    async def fetch(self):
+        """ Fetch the data from the GrandExchange """
+        # Find item ID, unless the caller already knows it
+        if self.item_id == '':
+            await self.find_item_id()
+            if self.multiple_results:
+                return
+
+        # Price info and graph data
+        payloads = await price_cache.get(self.item_id)
+        if payloads is None:
             raise NoResults(f'No results for {self.query} found')
-        data = response.json()
-        self.graph_data = graph_response.json()
+        data, self.graph_data = payloads
 
         # Assign variables
         self.icon = data['item']['icon_large']
@@ -143,15 +322,19 @@ class GrandExchange:
         self.day90_change = data['item']['day90']['change']
         self.day180_trend = data['item']['day180']['trend']
         self.day180_change = data['item']['day180']['change']
+        if self.window != DEFAULT_WINDOW:
+            _, prices = await price_history.read(self.id, self.window)
+            if len(prices) > 1 and prices[0] > 0:
+                self.window_change = f'{(prices[-1] - prices[0]) / prices[0]:+.1%}'
 
         # OSRSBox details
-        all_db_items = items_api.load()
-        for item in all_db_items:
-            if str(item.id) == self.item_id:
-                if item.buy_limit:
-                    self.buy_limit = f'{item.buy_limit:,}'
-                if item.highalch:
-                    self.high_alch = f'{item.highalch:,}'
+        await item_db.load()
+        item = item_db.get(self.id)
+        if item:
+            if item.buy_limit:
+                self.buy_limit = f'{item.buy_limit:,}'
+            if item.highalch:
+                self.high_alch = f'{item.highalch:,}'
 
     def get_possible_matches_str(self):
         """ Returns a string of the top possible matches """
@@ -170,3 +353,11 @@ class MissingQuery(Exception):
 
 class NoResults(TypeError):
     pass
+
+
+class GEUnavailable(Exception):
+    pass
+
+
+# Shared by every GrandExchange lookup
+price_cache = PriceCache()
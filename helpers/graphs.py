@@ -0,0 +1,100 @@
+# Renders GE price graphs to PNG bytes in worker processes, so renders never block the bot or share a file
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from helpers.cache import SingleFlight
+
+GRAPH_WORKERS = 2
+# Rendered graphs kept, popular items stay cached until the GE updates
+MAX_CACHED_GRAPHS = 256
+
+
+def render_price_graph(prices, average, labels, title='Past 180 days'):
+    """ Draws the daily prices, their moving average and the high/mid/low labels, returns PNG bytes.
+    Runs in a worker process so it only uses the object oriented Figure API """
+    figure = Figure(figsize=(8, 3))
+    FigureCanvasAgg(figure)
+    axes = figure.subplots()
+    for spine in axes.spines.values():
+        spine.set_visible(False)
+    # Axis labels
+    high = max(prices)
+    mid = sum(prices) / len(prices)
+    low = min(prices)
+    axes.set_yticks([high, mid, low])
+    axes.set_yticklabels(labels)
+    axes.tick_params(axis='y', colors='lightslategrey')
+    axes.set_xticks([])
+    # Average line
+    axes.axhline(y=mid, dashes=[1, 3])
+    # Title, plot, and save
+    axes.set_title(title, loc='right', color='lightslategrey')
+    axes.plot(average, color="red")
+    axes.plot(prices, color="lightslategrey")
+    buffer = BytesIO()
+    figure.savefig(buffer, format='png', transparent=True)
+    return buffer.getvalue()
+
+
+class GraphRenderer:
+    """ Renders graphs in a process pool, caching the PNGs by (item id, latest GE data point) """
+
+    def __init__(self, workers=GRAPH_WORKERS, max_graphs=MAX_CACHED_GRAPHS):
+        self.workers = workers
+        self.max_graphs = max_graphs
+        self.pool = None
+        self.graphs = OrderedDict()
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get_pool(self):
+        """ Returns the process pool, starting it on first use """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def cached(self, key):
+        """ Returns a BytesIO holding the cached graph PNG for key, or None if it isn't rendered yet """
+        png = self.graphs.get(key)
+        if png is None:
+            return None
+        self.hits += 1
+        self.graphs.move_to_end(key)
+        return BytesIO(png)
+
+    async def render(self, key, prices, average, labels, title='Past 180 days'):
+        """ Returns a BytesIO holding the graph PNG for key, rendering it only if it isn't cached """
+        png = self.graphs.get(key)
+        if png is not None:
+            self.hits += 1
+            self.graphs.move_to_end(key)
+        else:
+            self.misses += 1
+            png = await self.flights.run(key, lambda: self.load(key, prices, average, labels, title))
+        return BytesIO(png)
+
+    async def load(self, key, prices, average, labels, title):
+        """ Renders one graph in the pool and caches it """
+        loop = asyncio.get_event_loop()
+        png = await loop.run_in_executor(self.get_pool(), render_price_graph, prices, average, labels, title)
+        self.graphs[key] = png
+        while len(self.graphs) > self.max_graphs:
+            self.graphs.popitem(last=False)
+        return png
+
+    def close(self):
+        """ Stops the worker processes """
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+# Shared by the GE lookups
+graph_renderer = GraphRenderer()
@@ -0,0 +1,135 @@
+# Declarative, versioned layouts of the index_lite hiscore rows
+# When Jagex adds a boss or activity, add a new layout to LAYOUTS instead of touching the parser
+
+import logging
+from array import array
+from collections import Counter
+
+# Row kinds
+SKILL = 'skill'
+ACTIVITY = 'activity'
+CLUE = 'clue'
+BOSS = 'boss'
+UNUSED = 'unused'
+
+# (kind, attribute prefix, display name)
+SKILLS = [(SKILL, 'overall', 'Overall'), (SKILL, 'attack', 'Attack'), (SKILL, 'defence', 'Defence'),
+          (SKILL, 'strength', 'Strength'), (SKILL, 'hitpoints', 'Hitpoints'), (SKILL, 'ranged', 'Ranged'),
+          (SKILL, 'prayer', 'Prayer'), (SKILL, 'magic', 'Magic'), (SKILL, 'cooking', 'Cooking'),
+          (SKILL, 'woodcutting', 'Woodcutting'), (SKILL, 'fletching', 'Fletching'), (SKILL, 'fishing', 'Fishing'),
+          (SKILL, 'firemaking', 'Firemaking'), (SKILL, 'crafting', 'Crafting'), (SKILL, 'smithing', 'Smithing'),
+          (SKILL, 'mining', 'Mining'), (SKILL, 'herblore', 'Herblore'), (SKILL, 'agility', 'Agility'),
+          (SKILL, 'thieving', 'Thieving'), (SKILL, 'slayer', 'Slayer'), (SKILL, 'farming', 'Farming'),
+          (SKILL, 'runecraft', 'Runecrafting'), (SKILL, 'hunter', 'Hunter'),
+          (SKILL, 'construction', 'Construction')]
+
+CLUES = [(ACTIVITY, 'all_clues', 'All'), (CLUE, 'beginner_clues', 'Beginner'), (CLUE, 'easy_clues', 'Easy'),
+         (CLUE, 'medium_clues', 'Medium'), (CLUE, 'hard_clues', 'Hard'), (CLUE, 'elite_clues', 'Elite'),
+         (CLUE, 'master_clues', 'Master')]
+
+BOSSES_2020 = [(BOSS, 'abyssal_sire', 'Abyssal Sire'), (BOSS, 'alchemical_hydra', 'Alchemical Hydra'),
+               (BOSS, 'barrows_chest', 'Barrows Chest'), (BOSS, 'bryophyta', 'Bryophyta'),
+               (BOSS, 'callisto', 'Callisto'), (BOSS, 'cerberus', 'Cerberus'),
+               (BOSS, 'chambers_of_xeric', 'Chambers of Xeric'),
+               (BOSS, 'chambers_of_xeric_challenge', 'Chambers of Xeric: Challenge Mode'),
+               (BOSS, 'chaos_elemental', 'Chaos Elemental'), (BOSS, 'chaos_fanatic', 'Chaos Fanatic'),
+               (BOSS, 'commander_zilyana', 'Commander Zilyana'), (BOSS, 'corporeal_beast', 'Corporeal Beast'),
+               (BOSS, 'crazy_archaeologist', 'Crazy Archaeologist'), (BOSS, 'dagannoth_prime', 'Dagannoth Prime'),
+               (BOSS, 'dagannoth_rex', 'Dagannoth Rex'), (BOSS, 'dagannoth_supreme', 'Dagannoth Supreme'),
+               (BOSS, 'deranged_archaeologist', 'Deranged Archaeologist'),
+               (BOSS, 'general_graardor', 'General Graardor'), (BOSS, 'giant_mole', 'Giant Mole'),
+               (BOSS, 'grotesque_guardians', 'Grotesque Guardians'), (BOSS, 'hespori', 'Hespori'),
+               (BOSS, 'kalphite_queen', 'Kalphite Queen'), (BOSS, 'king_black_dragon', 'King Black Dragon'),
+               (BOSS, 'kraken', 'Kraken'), (BOSS, 'kreearra', "Kree'Arra"),
+               (BOSS, 'kril_tsutsaroth', "K'ril Tsutsaroth"), (BOSS, 'mimic', 'Mimic'), (BOSS, 'obor', 'Obor'),
+               (BOSS, 'nightmare', 'The Nightmare'), (BOSS, 'sarachnis', 'Sarachnis'),
+               (BOSS, 'scorpia', 'Scorpia'), (BOSS, 'skotizo', 'Skotizo'), (BOSS, 'the_gauntlet', 'The Gauntlet'),
+               (BOSS, 'the_corrupted_gauntlet', 'The Corrupted Gauntlet'),
+               (BOSS, 'theatre_of_blood', 'Theatre of Blood'),
+               (BOSS, 'thermonuclear_smoke_devil', 'Thermonuclear Smoke Devil'), (BOSS, 'tzkal_zuk', 'TzKal-Zuk'),
+               (BOSS, 'tztok_jad', 'TzTok-Jad'), (BOSS, 'venenatis', 'Venenatis'), (BOSS, 'vetion', "Vet'ion"),
+               (BOSS, 'vorkath', 'Vorkath'), (BOSS, 'wintertodt', 'Wintertodt'), (BOSS, 'zalcano', 'Zalcano'),
+               (BOSS, 'zulrah', 'Zulrah')]
+
+# Every known layout, oldest first
+LAYOUTS = [
+    (1, SKILLS
+     + [(UNUSED, 'league_points', 'League Points'),
+        (ACTIVITY, 'bounty_hunter_hunter', 'Bounty Hunter - Hunter'),
+        (ACTIVITY, 'bounty_hunter_rogue', 'Bounty Hunter - Rogue')]
+     + CLUES
+     + [(ACTIVITY, 'lms', 'Last Man Standing'),
+        (UNUSED, 'unknown_35', 'Unknown')]
+     + BOSSES_2020),
+]
+
+# Layout mismatches seen, keyed by row count
+schema_mismatches = Counter()
+
+
+class HiscoreSchema:
+    """ One version of the row layout with its attribute and table lookups precomputed """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.skill_count = sum(1 for (kind, _, _) in rows if kind == SKILL)
+        # Attribute name -> (column, row)
+        self.fields = {}
+        for row, (kind, prefix, _) in enumerate(rows):
+            if kind == SKILL:
+                self.fields[f'{prefix}_rank'] = ('rank', row)
+                self.fields[f'{prefix}_level'] = ('score', row)
+                self.fields[f'{prefix}_xp'] = ('xp', row)
+            elif kind == BOSS:
+                self.fields[f'kc_{prefix}'] = ('score', row)
+                self.fields[f'kc_{prefix}_rank'] = ('rank', row)
+            elif kind != UNUSED:
+                self.fields[f'{prefix}_rank'] = ('rank', row)
+                self.fields[f'{prefix}_score'] = ('score', row)
+        # (display name, row) used by the table generators, overall is left out of the levels
+        self.level_rows = [(name, row) for row, (kind, _, name) in enumerate(rows) if kind == SKILL and row > 0]
+        self.clue_rows = [(name, row) for row, (kind, _, name) in enumerate(rows) if kind == CLUE]
+        self.kc_rows = [(name, row) for row, (kind, _, name) in enumerate(rows) if kind == BOSS]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def problems(self, snapshot):
+        """ Returns a list of reasons the snapshot doesn't fit this layout """
+        problems = []
+        if len(snapshot) != len(self):
+            problems.append(f'{len(snapshot)} rows, expected {len(self)}')
+        if snapshot.skill_rows != self.skill_count:
+            problems.append(f'{snapshot.skill_rows} skill rows, expected {self.skill_count}')
+        for row in range(1, min(self.skill_count, len(snapshot))):
+            if snapshot.score[row] != -1 and not 1 <= snapshot.score[row] <= 126:
+                problems.append(f'level {snapshot.score[row]} in skill row {row}')
+                break
+        return problems
+
+
+SCHEMAS = {len(rows): HiscoreSchema(version, rows) for (version, rows) in LAYOUTS}
+LATEST = SCHEMAS[len(LAYOUTS[-1][1])]
+
+
+def apply_schema(snapshot):
+    """ Attaches the layout matching the snapshot's row count.
+    Unknown or invalid layouts are logged and counted, and only the skill rows are kept so nothing is mis-assigned """
+    schema = SCHEMAS.get(len(snapshot))
+    problems = schema.problems(snapshot) if schema else [f'no layout has {len(snapshot)} rows']
+    if not problems:
+        snapshot.schema = schema
+        return snapshot
+    schema_mismatches[len(snapshot)] += 1
+    logging.warning(f'Hiscore layout mismatch ({"; ".join(problems)}), '
+                    f'only reading skills with layout {LATEST.version}')
+    # Keep the leading skill rows and mark everything after them unranked
+    skills = min(snapshot.skill_rows, LATEST.skill_count)
+    padding = array('q', [-1]) * (len(LATEST) - skills)
+    snapshot.rank = snapshot.rank[:skills] + padding
+    snapshot.score = snapshot.score[:skills] + padding
+    snapshot.xp = snapshot.xp[:skills] + padding
+    snapshot.skill_rows = skills
+    snapshot.schema = LATEST
+    return snapshot
@@ -0,0 +1,220 @@
+# Shared async HTTP client used for every upstream request
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Connection pool settings
+TOTAL_CONNECTIONS = 100
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 60
+REQUEST_TIMEOUT = 20
+USER_AGENT = '!blue Discord bot (https://github.com/zedchance/blues_bot.py)'
+
+# Most in flight requests per host, hosts not listed use the default.
+# The limit adapts below this (AIMD): it grows by one per window of fast responses, and halves on an error or slow one
+DEFAULT_HOST_CONCURRENCY = 8
+HOST_CONCURRENCY = {
+    'secure.runescape.com': 16,
+    'services.runescape.com': 8,
+    'crystalmathlabs.com': 4,
+    'oldschool.runescape.wiki': 4,
+}
+LATENCY_TARGET = 2.0
+# Halving more often than this would collapse the limit on one burst of failures
+DECREASE_INTERVAL = 1.0
+# Circuit breaker: opens after this many failures in a row and fails requests fast,
+# then lets one probe through, waiting twice as long (up to the max) each time the probe fails
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 30
+MAX_OPEN_SECONDS = 300
+# Jagex redirects here when the hiscores are down
+UNAVAILABLE_PATH = '/unavailable'
+
+# Circuit states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half open'
+
+_session = None
+_host_limits = {}
+
+
+class Response:
+    """ A fully read response, mirrors the parts of requests.Response the helpers use """
+
+    def __init__(self, status_code, url, content):
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+
+    def json(self):
+        """ Decodes the body as JSON """
+        return json.loads(self.content)
+
+
+def get_session():
+    """ Returns the bot wide session, creating it on first use """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=TOTAL_CONNECTIONS,
+                                         ttl_dns_cache=DNS_CACHE_SECONDS,
+                                         keepalive_timeout=KEEPALIVE_SECONDS)
+        _session = aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                                         headers={'User-Agent': USER_AGENT})
+        logging.info('Opened shared HTTP session')
+    return _session
+
+
+class HostLimiter:
+    """ Adaptive concurrency limit and circuit breaker for one upstream host """
+
+    def __init__(self, host, ceiling):
+        self.host = host
+        self.ceiling = ceiling
+        self.limit = float(ceiling)
+        self.in_flight = 0
+        self.changed = asyncio.Condition()
+        self.state = CLOSED
+        # Failures in a row
+        self.failures = 0
+        self.opened_at = 0
+        self.open_for = OPEN_SECONDS
+        self.probing = False
+        self.last_decrease = 0
+        self.rejected = 0
+
+    def check(self):
+        """ Raises CircuitOpen while requests should fail fast, an open circuit goes half open once it has waited """
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_for - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(self.host, remaining)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and self.probing:
+            raise CircuitOpen(self.host, REQUEST_TIMEOUT)
+
+    async def acquire(self):
+        """ Waits for a slot under the limit, returns True if this request is the half open probe """
+        async with self.changed:
+            while True:
+                try:
+                    self.check()
+                except CircuitOpen:
+                    self.rejected += 1
+                    raise
+                if self.state == HALF_OPEN:
+                    self.probing = True
+                    self.in_flight += 1
+                    return True
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return False
+                await self.changed.wait()
+
+    async def release(self, probe, latency, failed):
+        """ Frees the slot and adapts to how the request went, latency is None if it never finished """
+        async with self.changed:
+            self.in_flight -= 1
+            if probe:
+                self.probing = False
+            now = time.monotonic()
+            if failed:
+                self.failures += 1
+                self.decrease(now)
+                if self.state == HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+                    self.trip(now)
+            elif latency is not None:
+                self.failures = 0
+                if self.state == HALF_OPEN:
+                    logging.info(f'Circuit to {self.host} closed')
+                    self.state = CLOSED
+                    self.open_for = OPEN_SECONDS
+                if latency > LATENCY_TARGET:
+                    self.decrease(now)
+                else:
+                    self.limit = min(self.limit + 1 / self.limit, self.ceiling)
+            # Waiters recheck the limit, or fail fast if the circuit just opened
+            self.changed.notify_all()
+
+    def decrease(self, now):
+        if now - self.last_decrease >= DECREASE_INTERVAL:
+            self.limit = max(self.limit / 2, 1)
+            self.last_decrease = now
+
+    def trip(self, now):
+        """ Opens the circuit, for longer if the half open probe just failed """
+        if self.state == HALF_OPEN:
+            self.open_for = min(self.open_for * 2, MAX_OPEN_SECONDS)
+        elif self.state == OPEN:
+            return
+        self.state = OPEN
+        self.opened_at = now
+        logging.warning(f'Circuit to {self.host} opened for {self.open_for}s after {self.failures} failures')
+
+    def status(self):
+        """ Returns a line describing the limiter """
+        status = f'{self.state}, {self.in_flight}/{int(self.limit)} in flight (max {self.ceiling})'
+        if self.state == OPEN:
+            status += f', retrying in {max(self.opened_at + self.open_for - time.monotonic(), 0):.0f}s'
+        return f'{status}, {self.failures} failures in a row, {self.rejected} failed fast'
+
+
+def host_limit(host):
+    """ Returns the limiter for requests to a host """
+    if host not in _host_limits:
+        _host_limits[host] = HostLimiter(host, HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+    return _host_limits[host]
+
+
+def status():
+    """ Returns host -> limiter status for every host requested so far """
+    return {host: limiter.status() for (host, limiter) in _host_limits.items()}
+
+
+async def get(url):
+    """ GETs a url through the shared connection pool and returns the read response.
+    Raises CircuitOpen straight away while the host is failing """
+    limiter = host_limit(urlsplit(url).hostname)
+    probe = await limiter.acquire()
+    started = time.monotonic()
+    latency = None
+    failed = False
+    try:
+        # aiohttp asks for gzip and decompresses transparently
+        async with get_session().get(url) as response:
+            content = await response.read()
+        latency = time.monotonic() - started
+        failed = response.status >= 500 or response.status == 429 or \
+            urlsplit(str(response.url)).path == UNAVAILABLE_PATH
+        return Response(response.status, str(response.url), content)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        failed = True
+        raise
+    finally:
+        await limiter.release(probe, latency, failed)
+
+
+async def close():
+    """ Closes the shared session """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+class CircuitOpen(Exception):
+
+    def __init__(self, host, retry_after):
+        super().__init__(f'{host} is unavailable, retrying in {retry_after:.0f}s')
+        self.host = host
+        self.retry_after = retry_after
+
+
+# What a request to a failing upstream raises
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpen)
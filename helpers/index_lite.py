@@ -0,0 +1,41 @@
+# Parser for the plain text index_lite.ws hiscore format
+
+from array import array
+
+from helpers.hiscore_schema import apply_schema
+
+
+class HiscoreSnapshot:
+    """ One player's hiscore rows stored as rank, score and xp columns.
+    For skill rows the score column holds the level, rows without xp store -1.
+    schema is the HiscoreSchema the rows were validated against """
+
+    __slots__ = ('rank', 'score', 'xp', 'skill_rows', 'schema')
+
+    def __init__(self, rank, score, xp, skill_rows):
+        self.rank = rank
+        self.score = score
+        self.xp = xp
+        self.skill_rows = skill_rows
+        self.schema = None
+
+    def __len__(self):
+        return len(self.rank)
+
+
+def parse_index_lite(content):
+    """ Decodes the raw index_lite body into a HiscoreSnapshot checked against the known layouts.
+    The body is skill rows (rank,level,xp) followed by activity rows (rank,score), one per line """
+    lines = content.split()
+    skill_rows = 0
+    while skill_rows < len(lines) and lines[skill_rows].count(b',') == 2:
+        skill_rows += 1
+    # Convert every field in one pass, then slice the columns back out
+    values = array('q', map(int, b','.join(lines).split(b',')))
+    split = 3 * skill_rows
+    if len(values) != split + 2 * (len(lines) - skill_rows):
+        raise ValueError('Unexpected index_lite row layout')
+    rank = values[0:split:3] + values[split::2]
+    score = values[1:split:3] + values[split + 1::2]
+    xp = values[2:split:3] + array('q', [-1]) * (len(lines) - skill_rows)
+    return apply_schema(HiscoreSnapshot(rank, score, xp, skill_rows))
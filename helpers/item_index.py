@@ -0,0 +1,232 @@
+# In memory item name index, answers exact, prefix, substring and fuzzy queries without a GE search
+
+import asyncio
+import json
+import logging
+from bisect import bisect_left
+from collections import Counter
+
+from helpers.itemdb import item_db, preferred
+
+ITEM_IDS_PATH = 'assets/item_ids.json'
+ALIASES_PATH = 'assets/item_aliases.json'
+
+# Fuzzy matching settings
+FUZZY_CANDIDATES = 30
+# A best match must beat the runner up by this much to be trusted
+FUZZY_MARGIN = 0.05
+# Confidence needed to skip asking the user which item they meant
+CONFIDENT = 0.8
+# Confidence needed to go with the closest name when the GE search finds nothing, below it the name is a suggestion
+LIKELY = 0.6
+
+# Match kinds, best first
+EXACT = 0
+PREFIX = 1
+WORD_PREFIX = 2
+SUBSTRING = 3
+
+
+def trigrams(text):
+    """ Returns the set of 3 character substrings of text """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def read_item_ids():
+    """ Reads (id, name) pairs from the bundled item_ids.json """
+    with open(ITEM_IDS_PATH) as file:
+        return [(i['id'], i['name']) for i in json.load(file)]
+
+
+def read_aliases():
+    """ Reads the curated nickname -> item name table """
+    with open(ALIASES_PATH) as file:
+        return {alias.lower(): name.lower() for alias, name in json.load(file).items()}
+
+
+def edit_distance(a, b, limit):
+    """ Levenshtein distance between two strings, gives up with limit + 1 once it must exceed limit """
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def word_prefixes(query_words, name_words):
+    """ True if every query word starts a name word, in order (bandos chest -> bandos chestplate) """
+    position = 0
+    for word in query_words:
+        while position < len(name_words) and not name_words[position].startswith(word):
+            position += 1
+        if position == len(name_words):
+            return False
+        position += 1
+    return True
+
+
+def similarity(query, name, floor=0.0):
+    """ Scores how well a lowercase query matches a lowercase name, 1 is an exact match.
+    Scores that can't beat floor come back as floor or less without finishing the edit distances """
+    if query == name:
+        return 1.0
+    if word_prefixes(query.split(), name.split()):
+        return 0.8 + 0.2 * len(query) / len(name)
+    longest = max(len(query), len(name))
+    distance = edit_distance(query, name, int((1 - floor) * longest))
+    score = 1 - distance / longest
+    # Typos in a partly typed name are compared against the same length of the name, worth at most 0.85
+    if len(name) > len(query) and max(score, floor) < 0.85:
+        partial_floor = max(score, floor) / 0.85
+        distance = edit_distance(query, name[:len(query)], int((1 - partial_floor) * len(query)))
+        score = max(score, 0.85 * (1 - distance / len(query)))
+    return score
+
+
+class ItemIndex:
+    """ Trigram inverted index plus a sorted name array over every tradeable item name """
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.lowered = []
+        self.exact = {}
+        self.sorted_names = []
+        self.postings = {}
+        self.aliases = {}
+        self.loading = None
+
+    def build(self, items, aliases=None):
+        """ Builds the index from (id, name) pairs, the first id seen for a name wins """
+        ids, names, exact = [], [], {}
+        for (item_id, name) in items:
+            if name.lower() not in exact:
+                exact[name.lower()] = len(ids)
+                ids.append(item_id)
+                names.append(name)
+        lowered = [name.lower() for name in names]
+        postings = {}
+        for position, name in enumerate(lowered):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(position)
+        self.sorted_names = sorted((name, position) for position, name in enumerate(lowered))
+        self.ids, self.names, self.lowered, self.exact, self.postings = ids, names, lowered, exact, postings
+        self.aliases = aliases or {}
+
+    def start(self):
+        """ Starts building the index if it isn't already, returns the build task """
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self.load_items())
+        return self.loading
+
+    async def load(self):
+        """ Waits for the index to be built, starting it if needed """
+        try:
+            await asyncio.shield(self.start())
+        except Exception:
+            self.loading = None
+            raise
+
+    async def load_items(self):
+        """ Indexes item_ids.json plus every GE tradeable osrsbox item """
+        loop = asyncio.get_event_loop()
+        items = await loop.run_in_executor(None, read_item_ids)
+        aliases = await loop.run_in_executor(None, read_aliases)
+        await item_db.load()
+        items += [(item.id, item.name) for item in item_db.by_id.values() if preferred(item)]
+        await loop.run_in_executor(None, self.build, items, aliases)
+        logging.info(f'Indexed {len(self.ids)} item names')
+
+    def candidates(self, query):
+        """ Positions of names containing query """
+        grams = trigrams(query)
+        if not grams:
+            # Too short for trigrams, the names are few enough to just scan
+            return [position for position, name in enumerate(self.lowered) if query in name]
+        lists = sorted((self.postings.get(gram, []) for gram in grams), key=len)
+        matches = set(lists[0])
+        for postings in lists[1:]:
+            matches.intersection_update(postings)
+            if not matches:
+                break
+        return [position for position in matches if query in self.lowered[position]]
+
+    def prefixed(self, query):
+        """ Positions of names starting with query, from the sorted name array """
+        positions = []
+        start = bisect_left(self.sorted_names, (query,))
+        for name, position in self.sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            positions.append(position)
+        return positions
+
+    def search(self, query, limit=10):
+        """ Returns up to limit (id, name, match kind) tuples for query, best match first """
+        query = ' '.join(query.lower().split())
+        if query == '':
+            return []
+        if query in self.exact:
+            position = self.exact[query]
+            ranked = [(EXACT, position)]
+        else:
+            ranked = []
+        prefixed = set(self.prefixed(query))
+        for position in prefixed:
+            if self.lowered[position] != query:
+                ranked.append((PREFIX, position))
+        for position in self.candidates(query):
+            if position in prefixed or self.lowered[position] == query:
+                continue
+            name = self.lowered[position]
+            kind = WORD_PREFIX if f' {query}' in f' {name}' else SUBSTRING
+            ranked.append((kind, position))
+        ranked.sort(key=lambda match: (match[0], len(self.names[match[1]]), self.lowered[match[1]]))
+        return [(self.ids[position], self.names[position], kind) for (kind, position) in ranked[:limit]]
+
+    def fuzzy(self, query):
+        """ Returns (id, name, confidence) of the closest name to query (aliases, typos and partial words
+        allowed), or None. Confidence is 1 for exact names and aliases, and halved when the match is ambiguous """
+        query = ' '.join(query.lower().split())
+        position = self.exact.get(self.aliases.get(query, query))
+        if position is not None:
+            return self.ids[position], self.names[position], 1.0
+        if len(query) < 3:
+            return None
+        # Only score the names sharing the most trigrams with the query, plus names it prefixes
+        shared = Counter()
+        for gram in trigrams(query):
+            shared.update(self.postings.get(gram, ()))
+        positions = {position for (position, _) in shared.most_common(FUZZY_CANDIDATES)}
+        positions.update(self.prefixed(query)[:FUZZY_CANDIDATES])
+        if not positions:
+            return None
+        # Best trigram overlaps first so the floor rises quickly and prunes the rest
+        scored = []
+        floor = 0.0
+        for position in sorted(positions, key=lambda p: -shared[p]):
+            score = similarity(query, self.lowered[position], floor)
+            scored.append((score, -len(self.lowered[position]), position))
+            floor = max(floor, score - FUZZY_MARGIN)
+        scored.sort(reverse=True)
+        best_score, _, best = scored[0]
+        confidence = best_score
+        if len(scored) > 1:
+            second_score, _, second = scored[1]
+            # Dragon scimitar is a fine answer for "dragon scim" even though Dragon scimitar (or) scores close
+            if best_score - second_score < FUZZY_MARGIN \
+                    and not self.lowered[second].startswith(self.lowered[best]):
+                confidence = best_score / 2
+        return self.ids[best], self.names[best], confidence
+
+
+# Shared by the GE lookups
+item_index = ItemIndex()
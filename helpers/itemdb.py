@@ -0,0 +1,69 @@
+# Process wide osrsbox item database, loaded once and indexed by id and name
+
+import asyncio
+import logging
+
+from osrsbox import items_api
+
+
+def preferred(item):
+    """ True for the version of an item name lookups should return (tradeable, not noted or a placeholder) """
+    return item.tradeable_on_ge and not item.noted and not item.placeholder
+
+
+class ItemDB:
+    """ osrsbox items indexed by id and lowercase name, loaded once in a worker thread """
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+        self.loading = None
+
+    @property
+    def loaded(self):
+        return len(self.by_id) > 0
+
+    def start(self):
+        """ Starts loading in the background if it isn't already, returns the loading future """
+        if self.loading is None:
+            self.loading = asyncio.get_event_loop().run_in_executor(None, self.load_items)
+        return self.loading
+
+    async def load(self):
+        """ Waits for the database to finish loading, starting it if needed """
+        try:
+            await asyncio.shield(self.start())
+        except asyncio.CancelledError:
+            # A cancelled caller leaves the shared load running, unless the load itself was cancelled
+            if self.loading is not None and self.loading.cancelled():
+                self.loading = None
+            raise
+        except Exception:
+            # Let the next caller retry
+            self.loading = None
+            raise
+
+    def load_items(self):
+        """ Parses the osrsbox dump and builds the indexes, runs in a worker thread """
+        by_id = {}
+        by_name = {}
+        for item in items_api.load():
+            by_id[item.id] = item
+            name = item.name.lower()
+            if name not in by_name or (preferred(item) and not preferred(by_name[name])):
+                by_name[name] = item
+        self.by_name = by_name
+        self.by_id = by_id
+        logging.info(f'Loaded {len(by_id)} items from osrsbox')
+
+    def get(self, item_id):
+        """ Returns the item with an id, or None """
+        return self.by_id.get(int(item_id))
+
+    def find(self, name):
+        """ Returns the item with a name (case insensitive), or None """
+        return self.by_name.get(name.lower())
+
+
+# Shared by every module that needs item data
+item_db = ItemDB()
@@ -1,37 +1,165 @@
+# osrsbox monsters indexed by name, with their drop tables
+
+import asyncio
+import logging
+from bisect import bisect_left
 from fractions import Fraction
+from functools import lru_cache
 
-from osrsbox import monsters_api, items_api
+from osrsbox import monsters_api
 
-monsters = monsters_api.load()
-items = items_api.load()
+from helpers.item_index import trigrams
+from helpers.itemdb import item_db
 
+# Drops shown on the monster embed
+RAREST_DROPS = 5
 
-def load_monster_from_api(monster):
-    loaded_monster = [x for x in monsters if x.name.lower() == monster.lower()]
-    if len(loaded_monster) == 0:
-        loaded_monster = [x for x in monsters if monster.lower() in x.name.lower()]
-    if len(loaded_monster) == 0:
-        return False
-    returned_monsters = []
-    for x in loaded_monster:
-        if x.name not in [x.name.lower() for x in returned_monsters]:
-            if x.name not in [x.name for x in returned_monsters]:
-                returned_monsters.append(x)
-    return returned_monsters
-
-
-def parse_monster_drops(drops):
-    sorted_drops = []
-    for x_drops in drops:
-        for x_items in items:
-            if x_items.name.lower() == x_drops.name.lower():
-                rarity_string = (str(Fraction(x_drops.rarity).limit_denominator())).split('/')
-                if len(rarity_string) > 1:
-                    rarity_string = f"{rarity_string[0]}/{int(rarity_string[1]):,d}"
-                else:
-                    rarity_string = "1/1"
-                sorted_drops.append({"name": x_drops.name, "rarity_string": rarity_string,
-                                     "rarity_int": x_drops.rarity})
+
+@lru_cache(maxsize=None)
+def rarity_string(rarity):
+    """ Formats a drop rate as a fraction, 1/5,000 """
+    fraction = Fraction(rarity).limit_denominator()
+    if fraction.denominator == 1:
+        return "1/1"
+    return f"{fraction.numerator}/{fraction.denominator:,d}"
+
+
+def summarize_drops(drops, item_names):
+    """ Returns (name, rarity string, rarity) for every drop that is a real item, rarest first, without repeats.
+    item_names is a set of lowercase item names """
+    summary = dict.fromkeys((drop.name, rarity_string(drop.rarity), drop.rarity) for drop in drops
+                            if drop.name.lower() in item_names)
+    return tuple(sorted(summary, key=lambda drop: drop[2]))
+
+
+class MonsterIndex:
+    """ Monster names grouped into variants (every monster sharing a name), with an exact name dict,
+    trigram postings for substring queries and a sorted name array for prefixes """
+
+    def __init__(self):
+        # Group position -> every variant with that name, in osrsbox order
+        self.groups = []
+        self.lowered = []
+        self.exact = {}
+        self.postings = {}
+        self.sorted_names = []
+        # Monster id -> drop summary, filled in the background once item_db is loaded
+        self.summaries = {}
+        self.loading = None
+
+    @property
+    def loaded(self):
+        return len(self.groups) > 0
+
+    def build(self, monsters):
+        """ Builds the index from osrsbox monsters, groups keep the order names first appear in """
+        groups, lowered, exact = [], [], {}
+        for monster in monsters:
+            name = monster.name.lower()
+            if name not in exact:
+                exact[name] = len(groups)
+                groups.append([])
+                lowered.append(name)
+            groups[exact[name]].append(monster)
+        postings = {}
+        for position, name in enumerate(lowered):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(position)
+        self.sorted_names = sorted((name, position) for position, name in enumerate(lowered))
+        self.groups, self.lowered, self.exact, self.postings = groups, lowered, exact, postings
+
+    def start(self):
+        """ Starts loading in the background if it isn't already, returns the loading task """
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self.load_all())
+        return self.loading
+
+    async def load(self):
+        """ Waits for the index and drop summaries to be built, starting them if needed """
+        try:
+            await asyncio.shield(self.start())
+        except Exception:
+            self.loading = None
+            raise
+
+    async def load_all(self):
+        """ Builds the index, then the drop summaries once the item names are known """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.load_monsters)
+        await item_db.load()
+        await loop.run_in_executor(None, self.summarize_all)
+
+    def load_monsters(self):
+        """ Parses the osrsbox dump and builds the index, runs in a worker thread """
+        self.build(monsters_api.load())
+        logging.info(f'Indexed {len(self.groups)} monster names')
+
+    def summarize_all(self):
+        """ Precomputes every monster's drop summary, runs in a worker thread """
+        item_names = set(item_db.by_name)
+        self.summaries = {monster.id: summarize_drops(monster.drops, item_names)
+                          for group in self.groups for monster in group}
+        logging.info(f'Summarized drops of {len(self.summaries)} monsters')
+
+    def drop_summary(self, monster):
+        """ Returns (name, rarity string, rarity) for a monster's item drops, rarest first """
+        summary = self.summaries.get(monster.id)
+        if summary is None:
+            summary = summarize_drops(monster.drops, set(item_db.by_name))
+            self.summaries[monster.id] = summary
+        return summary
+
+    def containing(self, query):
+        """ Group positions of names containing query, in osrsbox order """
+        grams = trigrams(query)
+        if not grams:
+            return [position for position, name in enumerate(self.lowered) if query in name]
+        lists = sorted((self.postings.get(gram, []) for gram in grams), key=len)
+        matches = set(lists[0])
+        for postings in lists[1:]:
+            matches.intersection_update(postings)
+            if not matches:
                 break
-    sorted_drops = [i for n, i in enumerate(sorted_drops) if i not in sorted_drops[n + 1:]]
-    return sorted(sorted_drops, key=lambda i: i['rarity_int'], reverse=False)
+        return sorted(position for position in matches if query in self.lowered[position])
+
+    def prefixed(self, query):
+        """ Group positions of names starting with query, in osrsbox order """
+        positions = []
+        start = bisect_left(self.sorted_names, (query,))
+        for name, position in self.sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            positions.append(position)
+        return sorted(positions)
+
+    def variants(self, name):
+        """ Every monster with a name (case insensitive) """
+        position = self.exact.get(name.lower())
+        return list(self.groups[position]) if position is not None else []
+
+    def lookup(self, query):
+        """ Returns one monster per matching name: the exact name if there is one, otherwise every name
+        containing the query with the names starting with it first. An empty list if nothing matches """
+        query = query.lower()
+        position = self.exact.get(query)
+        if position is not None:
+            return [self.groups[position][0]]
+        prefixed = self.prefixed(query)
+        starts = set(prefixed)
+        positions = prefixed + [position for position in self.containing(query) if position not in starts]
+        return [self.groups[position][0] for position in positions]
+
+
+def load_monster_from_api(monster):
+    """ Returns the monsters matching a name, or False. Needs monster_index to be loaded """
+    matches = monster_index.lookup(monster)
+    return matches if len(matches) > 0 else False
+
+
+def rarest_drops(monster, count=RAREST_DROPS):
+    """ Returns the precomputed (name, rarity string, rarity) of a monster's rarest item drops """
+    return monster_index.drop_summary(monster)[:count]
+
+
+# Shared by the monster commands
+monster_index = MonsterIndex()
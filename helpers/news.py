@@ -1,9 +1,8 @@
 # Pulls latest news from OSRS site
 
-import asyncio
-import requests
 from bs4 import BeautifulSoup, NavigableString
 
+from helpers import http
 from helpers.urls import news_rss_feed
 
 
@@ -15,11 +14,8 @@ class News:
 
     async def fetch(self):
         """ Fetches the news """
-        # Event loop
-        loop = asyncio.get_event_loop()
         # Make request
-        req = loop.run_in_executor(None, requests.get, news_rss_feed)
-        response = await req
+        response = await http.get(news_rss_feed)
         if response.status_code == 404:
             print("404 from RSS feed")  # TODO
             return
@@ -0,0 +1,132 @@
+# Refreshes the hiscores of regularly looked up and registered players before they're asked for
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from helpers.hiscore import hiscore_cache, canonical_username
+
+REGISTERED_PATH = 'assets/registered_players.json'
+# Hiscore requests the prefetcher may make per minute
+PREFETCH_BUDGET = 30
+# Most looked up players considered, and how often they must have been looked up lately
+HOT_PLAYERS = 100
+MIN_LOOKUPS = 3
+# Entries expiring within this many seconds (before the next pass) are refreshed
+REFRESH_AHEAD = 90
+MAX_REGISTERED_PER_GUILD = 50
+# Lookup counts are halved this often, so a player stops being hot once people stop asking for them
+DECAY_INTERVAL = 10 * 60
+# Names the hiscores don't know are left alone this long before being tried again
+NOT_FOUND_BACKOFF = 6 * 60 * 60
+
+
+class Prefetcher:
+    """ Once a minute, refreshes registered players then the most looked up ones, within a request budget """
+
+    def __init__(self, budget=PREFETCH_BUDGET, path=REGISTERED_PATH):
+        self.budget = budget
+        self.path = path
+        # Guild id (as a string, it's a json key) -> canonical usernames
+        self.registered = self.read()
+        self.spent = 0
+        self.prefetched = 0
+        self.failures = 0
+        self.passes = 0
+        self.last_decay = time.monotonic()
+        # Canonical username -> monotonic time it can be prefetched again, for names that were a 404
+        self.not_found = {}
+
+    def read(self):
+        """ Reads the registered players, an empty dict if there's no file yet """
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def save(self):
+        """ Writes the registered players, replacing the old file in one step """
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w') as file:
+            json.dump(self.registered, file, indent=2)
+        os.replace(temp, self.path)
+
+    def register(self, guild_id, username):
+        """ Registers a player for a guild, returns False if it's already registered """
+        players = self.registered.setdefault(str(guild_id), [])
+        key = canonical_username(username)
+        if key in players:
+            return False
+        if len(players) >= MAX_REGISTERED_PER_GUILD:
+            raise TooManyRegistered(f'A server can register at most {MAX_REGISTERED_PER_GUILD} players.')
+        players.append(key)
+        self.save()
+        return True
+
+    def unregister(self, guild_id, username):
+        """ Removes a player from a guild, returns False if it wasn't registered """
+        players = self.registered.get(str(guild_id), [])
+        key = canonical_username(username)
+        if key not in players:
+            return False
+        players.remove(key)
+        if not players:
+            del self.registered[str(guild_id)]
+        self.save()
+        return True
+
+    def targets(self):
+        """ Returns the players due a refresh, registered first then most looked up first """
+        registered = {player for players in self.registered.values() for player in players}
+        hot = [player for (player, _) in hiscore_cache.sketch.top(HOT_PLAYERS, MIN_LOOKUPS)]
+        ordered = sorted(registered) + [player for player in hot if player not in registered]
+        now = time.monotonic()
+        return [player for player in ordered if hiscore_cache.expires_within(player, REFRESH_AHEAD)
+                and self.not_found.get(player, 0) <= now]
+
+    async def refresh(self):
+        """ Refreshes as many due players as the budget allows """
+        now = time.monotonic()
+        if now - self.last_decay >= DECAY_INTERVAL:
+            hiscore_cache.sketch.decay()
+            self.last_decay = now
+        self.not_found = {player: until for (player, until) in self.not_found.items() if until > now}
+        due = self.targets()[:self.budget]
+        self.spent = len(due)
+        self.passes += 1
+        results = await asyncio.gather(*[hiscore_cache.prefetch(player) for player in due], return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        for player in due:
+            entry = hiscore_cache.entries.get(player)
+            if entry is not None and entry[1] is None:
+                self.not_found[player] = now + NOT_FOUND_BACKOFF
+        self.prefetched += len(due) - len(failed)
+        self.failures += len(failed)
+        if failed:
+            logging.warning(f'Prefetching {len(failed)} of {len(due)} hiscores failed: {failed[0]!r}')
+
+    def status(self):
+        """ Returns a dict describing the prefetcher's hit rate and budget use """
+        lookups = hiscore_cache.hits + hiscore_cache.misses
+        return {
+            'registered': sum(len(players) for players in self.registered.values()),
+            'hot players': len(hiscore_cache.sketch.top(HOT_PLAYERS, MIN_LOOKUPS)),
+            'budget used': f'{self.spent}/{self.budget} last minute',
+            'passes': self.passes,
+            'prefetched': self.prefetched,
+            'failures': self.failures,
+            'not found': len(self.not_found),
+            'cache hit rate': f'{hiscore_cache.hits / lookups:.0%}' if lookups else 'n/a',
+            'prefetch hit rate': f'{hiscore_cache.prefetch_hits / lookups:.0%}' if lookups else 'n/a',
+        }
+
+
+class TooManyRegistered(Exception):
+    pass
+
+
+# Shared by the refresh loop and the register commands
+prefetcher = Prefetcher()
@@ -0,0 +1,166 @@
+# Per item GE price history, stored as memory mapped (timestamp, price) int64 pairs
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HISTORY_DIR = 'assets/history'
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Graph windows in days, None is everything stored
+WINDOWS = {'7d': 7, '30d': 30, '90d': 90, '180d': 180, '1y': 365, 'all': None}
+DEFAULT_WINDOW = '180d'
+# The GE's own average line is a 30 day moving average
+AVERAGE_DAYS = 30
+MAX_OPEN_HISTORIES = 256
+
+
+def series_from_graph(daily):
+    """ Converts the graph json's {timestamp string: price} dict to an (n, 2) int64 array sorted by timestamp """
+    series = np.empty((len(daily), 2), dtype=np.int64)
+    series[:, 0] = np.fromiter(map(int, daily), dtype=np.int64, count=len(daily))
+    series[:, 1] = np.fromiter(daily.values(), dtype=np.int64, count=len(daily))
+    return series[np.argsort(series[:, 0], kind='stable')]
+
+
+def moving_average(prices, days=AVERAGE_DAYS):
+    """ Trailing moving average, the first days - 1 points average what came before them """
+    totals = np.cumsum(prices, dtype=np.float64)
+    average = totals / np.arange(1, len(prices) + 1)
+    if len(prices) > days:
+        average[days:] = (totals[days:] - totals[:-days]) / days
+    return average
+
+
+class PriceHistory:
+    """ One file of (timestamp, price) int64 rows per item, appended as graph payloads come in.
+    Reads are memory mapped, so window queries are zero copy views found with searchsorted.
+    The bot goes through the async methods, which run every read and write on one worker thread,
+    so a compaction never races an append and the open maps are only touched from that thread """
+
+    def __init__(self, directory=HISTORY_DIR, max_open=MAX_OPEN_HISTORIES):
+        self.directory = directory
+        self.max_open = max_open
+        self.maps = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run(self, method, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, method, *args)
+
+    async def record(self, item_id, daily):
+        """ Appends a graph payload on the worker thread """
+        return await self.run(self.append, item_id, daily)
+
+    async def read(self, item_id, window=DEFAULT_WINDOW):
+        """ Returns copies of (timestamps, prices) over the window, read on the worker thread """
+        return await self.run(self.window_copy, item_id, window)
+
+    async def compact_stored(self):
+        """ Compacts every stored history on the worker thread """
+        return await self.run(self.compact_all)
+
+    async def due(self, item_ids, age):
+        """ Returns the item ids whose history is missing or wasn't appended to in the last age seconds """
+        return await self.run(self.stale_ids, item_ids, age)
+
+    def path(self, item_id):
+        return os.path.join(self.directory, f'{int(item_id)}.bin')
+
+    def open(self, item_id):
+        """ Returns the item's history as a read only (n, 2) array, empty if none is stored """
+        item_id = int(item_id)
+        history = self.maps.get(item_id)
+        if history is not None:
+            self.maps.move_to_end(item_id)
+            return history
+        path = self.path(item_id)
+        # A write cut short leaves a partial row at the end, which is ignored until compaction drops it
+        rows = os.path.getsize(path) // 16 if os.path.exists(path) else 0
+        if rows == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        history = np.memmap(path, dtype=np.int64, mode='r', shape=(rows, 2))
+        self.maps[item_id] = history
+        while len(self.maps) > self.max_open:
+            self.maps.popitem(last=False)
+        return history
+
+    def append(self, item_id, daily):
+        """ Appends the points of a graph payload newer than the stored history, returns how many were added """
+        history = self.open(item_id)
+        series = series_from_graph(daily)
+        if len(history):
+            series = series[series[:, 0] > history[-1, 0]]
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(item_id), 'ab') as file:
+            file.write(series.tobytes())
+        if len(series) == 0:
+            # Nothing new, but the modified time records the check so the history crawler moves on
+            os.utime(self.path(item_id))
+            return 0
+        # The open map has the old length
+        self.maps.pop(int(item_id), None)
+        return len(series)
+
+    def window(self, item_id, window=DEFAULT_WINDOW):
+        """ Returns (timestamps, prices) views covering the window before the latest point """
+        history = self.open(item_id)
+        days = WINDOWS[window]
+        if days is None or len(history) == 0:
+            return history[:, 0], history[:, 1]
+        start = np.searchsorted(history[:, 0], history[-1, 0] - days * DAY_MS, side='left')
+        return history[start:, 0], history[start:, 1]
+
+    def window_copy(self, item_id, window=DEFAULT_WINDOW):
+        timestamps, prices = self.window(item_id, window)
+        return np.array(timestamps), np.array(prices)
+
+    def stale_ids(self, item_ids, age):
+        """ Item ids whose file is missing or wasn't appended to or checked in age seconds, oldest first """
+        cutoff = time.time() - age
+        modified = [(os.path.getmtime(self.path(item_id)) if os.path.exists(self.path(item_id)) else 0, item_id)
+                    for item_id in item_ids]
+        return [int(item_id) for (when, item_id) in sorted(modified) if when < cutoff]
+
+    def compact(self, item_id):
+        """ Rewrites an item's file sorted with one point per timestamp, returns True if it changed """
+        history = np.array(self.open(item_id))
+        if len(history) == 0:
+            return False
+        order = np.argsort(history[:, 0], kind='stable')
+        history = history[order]
+        # Keep the last point written for each timestamp
+        keep = np.append(history[1:, 0] != history[:-1, 0], True)
+        whole = os.path.getsize(self.path(item_id)) == 16 * len(history)
+        if whole and keep.all() and (order == np.arange(len(order))).all():
+            return False
+        path = self.path(item_id)
+        with open(f'{path}.tmp', 'wb') as file:
+            file.write(history[keep].tobytes())
+        self.maps.pop(int(item_id), None)
+        os.replace(f'{path}.tmp', path)
+        return True
+
+    def compact_all(self):
+        """ Compacts every stored history, returns how many files were rewritten """
+        if not os.path.isdir(self.directory):
+            return 0
+        compacted = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.bin'):
+                compacted += self.compact(int(name[:-4]))
+        logging.info(f'Compacted {compacted} price histories')
+        return compacted
+
+    def close(self):
+        """ Finishes queued writes """
+        self.executor.shutdown(wait=True)
+
+
+# Shared by the GE lookups
+price_history = PriceHistory()
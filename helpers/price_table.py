@@ -0,0 +1,250 @@
+# Local table of current GE prices for every tradeable item, kept fresh by a background crawler
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from helpers import http
+from helpers.ge import GEUnavailable, is_rounded, latest_price, parse_price, price_cache
+from helpers.item_index import read_item_ids
+from helpers.price_history import price_history
+from helpers.urls import ge_api_item_url
+
+PRICE_TABLE_PATH = 'assets/price_table.npy'
+
+# price and change are -1 / 0 until an item is crawled, update is the GE update the row was fetched under
+PRICE_DTYPE = np.dtype([('id', np.int32), ('price', np.int64), ('change', np.int64), ('trend', np.int8),
+                        ('update', np.int64), ('updated', np.float64)])
+TRENDS = {'negative': -1, 'neutral': 0, 'positive': 1}
+TREND_NAMES = {value: name for name, value in TRENDS.items()}
+
+# Crawler settings
+# Rows older than this are stale even if no GE update has been seen (seconds)
+PRICE_TABLE_TTL = 6 * 60 * 60
+# Items fetched per crawler tick, and at once
+CRAWL_BATCH = 120
+CRAWL_CONCURRENCY = 4
+# Always refreshed first, the calculators price these constantly
+HOT_ITEMS = [561, 565, 566, 560, 554, 555, 556, 557, 562, 563, 9075, 21880]
+# Looked up items also crawled ahead of the long tail
+MAX_HOT_ITEMS = 200
+HOT_REFRESH = 30 * 60
+# Graph payloads hold the last 180 days, so fetching each item's graph once a week keeps its history gap free
+HISTORY_REFRESH = 7 * 24 * 60 * 60
+# Graphs fetched per history crawler tick
+HISTORY_BATCH = 60
+
+
+class PriceTable:
+    """ Structured array of (id, price, change, trend, update, updated) rows sorted by id, saved with np.save.
+    The crawler refreshes hot items first, then the rows that were updated longest ago, so it picks up
+    where it left off after a restart """
+
+    def __init__(self, path=PRICE_TABLE_PATH):
+        self.path = path
+        self.rows = np.zeros(0, dtype=PRICE_DTYPE)
+        # Bumped whenever prices change, so derived tables know to recompute
+        self.version = 0
+        self.loading = None
+        self.requested = Counter()
+        self.crawled = 0
+        self.failures = 0
+        self.passes = 0
+        self.complete = False
+        self.pass_started = time.time()
+        self.last_crawl = None
+
+    def start(self):
+        """ Starts loading the table if it isn't already, returns the loading future """
+        if self.loading is None:
+            self.loading = asyncio.get_event_loop().run_in_executor(None, self.load_rows)
+        return self.loading
+
+    async def load(self):
+        """ Waits for the table to be loaded, starting it if needed """
+        try:
+            await asyncio.shield(self.start())
+        except asyncio.CancelledError:
+            # A cancelled caller leaves the shared load running, unless the load itself was cancelled
+            if self.loading is not None and self.loading.cancelled():
+                self.loading = None
+            raise
+        except Exception:
+            self.loading = None
+            raise
+
+    def load_rows(self):
+        """ Reads the saved table and adds a blank row for every item id it doesn't have yet """
+        rows = np.zeros(0, dtype=PRICE_DTYPE)
+        if os.path.exists(self.path):
+            try:
+                rows = np.load(self.path)
+            except (OSError, ValueError):
+                logging.exception(f'Unreadable price table {self.path}, starting a new one')
+        ids = np.unique([item_id for (item_id, _) in read_item_ids()])
+        missing = np.setdiff1d(ids, rows['id'])
+        blank = np.zeros(len(missing), dtype=PRICE_DTYPE)
+        blank['id'] = missing
+        blank['price'] = -1
+        rows = np.concatenate([rows, blank])
+        self.rows = rows[np.argsort(rows['id'], kind='stable')]
+        self.version += 1
+        logging.info(f'Loaded price table with {len(self.rows)} items')
+
+    def save(self):
+        """ Writes the table to disk, replacing the old file in one step """
+        temp = f'{self.path}.tmp.npy'
+        np.save(temp, self.rows)
+        os.replace(temp, self.path)
+
+    def position(self, item_id):
+        """ Returns the row index of an item id, or None """
+        position = np.searchsorted(self.rows['id'], item_id)
+        if position < len(self.rows) and self.rows['id'][position] == item_id:
+            return position
+        return None
+
+    def fresh_rows(self):
+        """ Boolean mask of rows crawled under the latest GE update and within the TTL """
+        return (self.rows['update'] >= price_cache.latest_update) \
+            & (self.rows['updated'] > time.time() - PRICE_TABLE_TTL)
+
+    def get(self, item_id):
+        """ Returns the item's row if it is fresh, otherwise None. Lookups mark items as hot for the crawler """
+        self.requested[int(item_id)] += 1
+        position = self.position(int(item_id))
+        if position is None:
+            return None
+        row = self.rows[position]
+        if row['price'] < 0 or row['update'] < price_cache.latest_update \
+                or row['updated'] <= time.time() - PRICE_TABLE_TTL:
+            return None
+        return row
+
+    def store(self, item_id, detail, price=None):
+        """ Updates an item's row from a catalogue detail payload, with price overriding its current price """
+        position = self.position(item_id)
+        if position is None:
+            return
+        item = detail['item']
+        if price is None:
+            price = parse_price(item['current']['price'])
+        self.rows[position] = (item_id, price, parse_price(item['today']['price']),
+                               TRENDS.get(item['today']['trend'], 0), price_cache.latest_update, time.time())
+
+    def next_batch(self, size):
+        """ Returns up to size item ids to crawl: stale hot items, then the longest since updated """
+        now = time.time()
+        batch = []
+        hot = HOT_ITEMS + [item_id for (item_id, _) in self.requested.most_common(MAX_HOT_ITEMS)]
+        for item_id in dict.fromkeys(hot):
+            position = self.position(item_id)
+            if position is None:
+                continue
+            row = self.rows[position]
+            if row['update'] < price_cache.latest_update or row['updated'] < now - HOT_REFRESH:
+                batch.append(item_id)
+            if len(batch) == size:
+                return batch
+        stale = np.flatnonzero(~self.fresh_rows())
+        oldest = stale[np.argsort(self.rows['updated'][stale], kind='stable')]
+        for item_id in self.rows['id'][oldest[:size]]:
+            if int(item_id) not in batch:
+                batch.append(int(item_id))
+            if len(batch) == size:
+                break
+        return batch
+
+    async def fetch(self, item_id, limit):
+        """ Fetches and stores one item's price """
+        async with limit:
+            try:
+                response = await http.get(ge_api_item_url + str(item_id))
+                if response.status_code == 404:
+                    # Not on the GE any more, left without a price until the next pass
+                    self.rows[self.position(item_id)] = (item_id, -1, 0, 0, price_cache.latest_update, time.time())
+                    return
+                detail = response.json()
+                price = None
+                if is_rounded(detail['item']['current']['price']):
+                    # The catalogue rounds prices from 10k up, the latest graph point is exact
+                    loaded = await price_cache.get(item_id)
+                    price = latest_price(loaded[1]) if loaded is not None else None
+                    if price is None:
+                        # Left unpriced rather than stored rounded, until the next pass
+                        self.rows[self.position(item_id)] = (item_id, -1, 0, 0, price_cache.latest_update,
+                                                             time.time())
+                        return
+                self.store(item_id, detail, price)
+                self.crawled += 1
+            except (http.CircuitOpen, GEUnavailable):
+                # The GE is down, the rest of the batch fails fast and is retried next pass
+                pass
+            except Exception as error:
+                self.failures += 1
+                logging.warning(f'Price crawl of item {item_id} failed: {error}')
+
+    async def crawl(self, size=CRAWL_BATCH, concurrency=CRAWL_CONCURRENCY):
+        """ Refreshes one batch of items and saves the table """
+        await self.load()
+        # Fetching one hot item's graph notices a new GE update, which makes every older row stale
+        await price_cache.get(HOT_ITEMS[0])
+        batch = self.next_batch(size)
+        if not batch:
+            return
+        limit = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*[self.fetch(item_id, limit) for item_id in batch])
+        self.version += 1
+        self.last_crawl = time.time()
+        complete = bool(self.fresh_rows().all())
+        if complete and not self.complete:
+            self.passes += 1
+        elif self.complete and not complete:
+            # A GE update or the TTL made rows stale again, a new pass starts
+            self.pass_started = time.time()
+        self.complete = complete
+        await asyncio.get_event_loop().run_in_executor(None, self.save)
+
+    async def crawl_histories(self, size=HISTORY_BATCH, concurrency=CRAWL_CONCURRENCY):
+        """ Fetches the graphs of the items whose price history is missing or over a week old,
+        loading them through the GE cache appends them to the history """
+        await self.load()
+        tradeable = self.rows['id'][self.rows['price'] >= 0]
+        due = (await price_history.due(tradeable, HISTORY_REFRESH))[:size]
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(item_id):
+            async with limit:
+                try:
+                    await price_cache.get(item_id)
+                except GEUnavailable:
+                    # The GE is down, the rest of the batch fails fast and is retried next tick
+                    pass
+                except Exception as error:
+                    logging.warning(f'History crawl of item {item_id} failed: {error}')
+
+        await asyncio.gather(*[fetch(item_id) for item_id in due])
+
+    def status(self):
+        """ Returns a dict describing the crawler's progress and the table's staleness """
+        fresh = self.fresh_rows()
+        updated = self.rows['updated'][self.rows['updated'] > 0]
+        return {
+            'items': len(self.rows),
+            'fresh': int(fresh.sum()),
+            'never crawled': int((self.rows['updated'] == 0).sum()),
+            'oldest row': f'{(time.time() - updated.min()) / 3600:.1f} hrs' if len(updated) else 'n/a',
+            'crawled': self.crawled,
+            'failures': self.failures,
+            'completed passes': self.passes,
+            'pass running for': f'{(time.time() - self.pass_started) / 60:.0f} min',
+            'last crawl': f'{time.time() - self.last_crawl:.0f} s ago' if self.last_crawl else 'never',
+        }
+
+
+# Shared by the crawler and the price lookups
+price_table = PriceTable()
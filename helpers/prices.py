@@ -0,0 +1,82 @@
+# Resolves the current GE price of many items in one concurrent round trip
+
+import asyncio
+
+from helpers.ge import parse_price, price_cache
+from helpers.item_index import item_index, CONFIDENT, EXACT
+from helpers.price_table import price_table, TREND_NAMES
+from helpers.urls import ge_icon_url
+
+
+class ItemPrice:
+    """ The current price of one item, price is None when the query couldn't be resolved """
+
+    def __init__(self, query, item_id=None, name=None, closest_match=False):
+        self.query = query
+        self.id = item_id
+        self.name = name or query
+        self.closest_match = closest_match
+        self.icon = None
+        self.price = None
+        self.price_text = None
+        self.trend = None
+        self.todays_change = None
+
+    @property
+    def found(self):
+        return self.price is not None
+
+    def read_detail(self, detail):
+        """ Fills the price fields from a catalogue detail payload """
+        item = detail['item']
+        self.name = item['name']
+        self.icon = item['icon_large']
+        self.price_text = f"{item['current']['price']}"
+        self.price = parse_price(item['current']['price'])
+        self.trend = item['today']['trend']
+        self.todays_change = item['today']['price']
+
+    def read_row(self, row):
+        """ Fills the price fields from a fresh price table row """
+        self.icon = ge_icon_url(self.id)
+        self.price = int(row['price'])
+        self.price_text = f'{self.price:,}'
+        self.trend = TREND_NAMES[int(row['trend'])]
+        self.todays_change = f"{int(row['change']):+,}"
+
+
+def resolve_item(query):
+    """ Returns (id, name, closest match) for an item name or id, or None. Only local lookups, never a GE search """
+    query = query.strip()
+    if query.isdigit():
+        return int(query), None, False
+    candidates = item_index.search(query)
+    if len(candidates) == 1 or (len(candidates) > 0 and candidates[0][2] == EXACT):
+        return candidates[0][0], candidates[0][1], False
+    closest = item_index.fuzzy(query)
+    if closest and closest[2] >= CONFIDENT:
+        return closest[0], closest[1], closest[1].lower() != query.lower()
+    return None
+
+
+async def fetch_price(query):
+    """ Returns the ItemPrice of one item name or id, from the crawled price table when it is fresh,
+    otherwise from the detail endpoint """
+    resolved = resolve_item(query)
+    if resolved is None:
+        return ItemPrice(query)
+    item_price = ItemPrice(query, *resolved)
+    row = price_table.get(item_price.id)
+    if row is not None:
+        item_price.read_row(row)
+        return item_price
+    detail = await price_cache.get_detail(item_price.id)
+    if detail is not None:
+        item_price.read_detail(detail)
+    return item_price
+
+
+async def fetch_prices(queries):
+    """ Returns an ItemPrice for every item name or id, fetched concurrently and in the same order """
+    await item_index.load()
+    return await asyncio.gather(*[fetch_price(query) for query in queries])
@@ -0,0 +1,298 @@
+# Local SQLite store of every hiscore snapshot fetched, the xp tracker works off these
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SNAPSHOT_DB_PATH = 'assets/snapshots.db'
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# Retention: every snapshot for 48 hours, the last one of each hour for 30 days, the last one of each day after
+KEEP_ALL = 48 * HOUR
+KEEP_HOURLY = 30 * DAY
+# Every snapshot after a keyframe is stored as the rows that changed since the one before it
+KEYFRAME_INTERVAL = 32
+# Rank, score and xp
+COLUMNS = 3
+# A changed row in a delta: its uint16 index and three int64 values
+DELTA_ROW_BYTES = 2 + COLUMNS * 8
+# Players are compacted once a day, this many per executor job so lookups get a turn in between
+COMPACT_INTERVAL = DAY
+COMPACT_BATCH = 200
+# Latest snapshot per player kept decoded, so storing a new one doesn't read the database
+MAX_LATEST = 2000
+
+# A snapshot row is a keyframe holding the full (3, width) matrix, or a delta with width 0
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    player TEXT PRIMARY KEY,
+    checked REAL NOT NULL,
+    compacted REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    player TEXT NOT NULL,
+    taken REAL NOT NULL,
+    width INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (player, taken)
+) WITHOUT ROWID;
+'''
+
+
+def stack(snapshot):
+    """ A snapshot's rank, score and xp columns as one (3, rows) int64 matrix """
+    return np.array([snapshot.rank, snapshot.score, snapshot.xp], dtype=np.int64)
+
+
+def encode_delta(previous, current):
+    """ The rows that changed as uint16 indices followed by their (3, changed) values """
+    changed = np.flatnonzero((previous != current).any(axis=0)).astype(np.uint16)
+    return changed.tobytes() + np.ascontiguousarray(current[:, changed]).tobytes()
+
+
+def encode(taken, matrices):
+    """ Encodes a player's snapshots, oldest first, as (taken, width, data) rows.
+    Keyframes go first, every KEYFRAME_INTERVAL snapshots and wherever the hiscore layout changed """
+    rows = []
+    previous = None
+    for (index, (when, matrix)) in enumerate(zip(taken, matrices)):
+        if previous is None or previous.shape != matrix.shape or index % KEYFRAME_INTERVAL == 0:
+            rows.append((float(when), matrix.shape[1], matrix.tobytes()))
+        else:
+            rows.append((float(when), 0, encode_delta(previous, matrix)))
+        previous = matrix
+    return rows
+
+
+def decode(rows):
+    """ Rebuilds the (taken, matrix) snapshots from (taken, width, data) rows starting at a keyframe """
+    snapshots = []
+    current = None
+    for (taken, width, data) in rows:
+        if width:
+            current = np.frombuffer(data, dtype=np.int64).reshape(COLUMNS, width)
+        else:
+            count = len(data) // DELTA_ROW_BYTES
+            changed = np.frombuffer(data, dtype=np.uint16, count=count)
+            current = current.copy()
+            current[:, changed] = np.frombuffer(data, dtype=np.int64, offset=2 * count).reshape(COLUMNS, count)
+        snapshots.append((taken, current))
+    return snapshots
+
+
+def retained(taken, now):
+    """ Mask of the snapshots (taken sorted, oldest first) the retention policy keeps.
+    Each one falls in a bucket, its own if recent, else its hour or day; the last one of every bucket is kept """
+    taken = np.asarray(taken, dtype=np.float64)
+    age = now - taken
+    tier = np.where(age < KEEP_ALL, 0, np.where(age < KEEP_HOURLY, 1, 2))
+    bucket = np.where(tier == 0, np.arange(len(taken)), np.where(tier == 1, taken // HOUR, taken // DAY))
+    keep = np.ones(len(taken), dtype=bool)
+    keep[:-1] = (tier[1:] != tier[:-1]) | (bucket[1:] != bucket[:-1])
+    return keep
+
+
+class History:
+    """ A player's snapshots over a window as (snapshots, rows) int64 matrices, oldest first.
+    The first snapshot is the last one taken before the window, when there is one """
+
+    def __init__(self, taken, rank, score, xp, checked):
+        self.taken = taken
+        self.rank = rank
+        self.score = score
+        self.xp = xp
+        self.checked = checked
+
+    def __len__(self):
+        return len(self.taken)
+
+
+class SnapshotStore:
+    """ Records a snapshot whenever a player's hiscore changes, and the last time it was checked.
+    Every query runs on one worker thread, so they happen in the order they were submitted """
+
+    def __init__(self, path=SNAPSHOT_DB_PATH):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Player -> (taken, matrix, snapshots since its keyframe)
+        self.latest = OrderedDict()
+
+    def connect(self):
+        """ Returns the connection, creating the tables on first use """
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.migrate(self.connection)
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    @staticmethod
+    def migrate(connection):
+        """ Moves a database from the full row layout (a rank, score and xp blob per snapshot) to keyframes and deltas """
+        tables = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'snapshots' not in tables:
+            return
+        logging.info('Converting stored hiscore snapshots to deltas')
+        with connection:
+            connection.executescript(SCHEMA)
+            columns = {column[1] for column in connection.execute('PRAGMA table_info(players)')}
+            if 'compacted' not in columns:
+                connection.execute('ALTER TABLE players ADD COLUMN compacted REAL NOT NULL DEFAULT 0')
+            players = [player for (player,) in connection.execute('SELECT DISTINCT player FROM snapshots')]
+            for player in players:
+                rows = connection.execute('SELECT taken, rank, score, xp FROM snapshots WHERE player = ? '
+                                          'ORDER BY taken', (player,)).fetchall()
+                matrices = [np.frombuffer(b''.join(row[1:]), dtype=np.int64).reshape(COLUMNS, -1) for row in rows]
+                connection.executemany('INSERT INTO snapshot_rows VALUES (?, ?, ?, ?)',
+                                       [(player, *row) for row in encode([row[0] for row in rows], matrices)])
+            connection.execute('DROP TABLE snapshots')
+
+    def record(self, player, snapshot):
+        """ Queues a snapshot to be stored without waiting for it """
+        self.executor.submit(self.store, player, snapshot, time.time())
+
+    def remember(self, player, latest):
+        self.latest[player] = latest
+        self.latest.move_to_end(player)
+        while len(self.latest) > MAX_LATEST:
+            self.latest.popitem(last=False)
+
+    def latest_snapshot(self, connection, player):
+        """ Returns the player's (taken, matrix, snapshots since its keyframe), None if nothing is stored """
+        latest = self.latest.get(player)
+        if latest is not None:
+            return latest
+        rows = connection.execute('SELECT taken, width, data FROM snapshot_rows WHERE player = ? AND taken >= '
+                                  '(SELECT MAX(taken) FROM snapshot_rows WHERE player = ? AND width > 0) '
+                                  'ORDER BY taken', (player, player)).fetchall()
+        if not rows:
+            return None
+        (taken, matrix) = decode(rows)[-1]
+        return (taken, matrix, len(rows) - 1)
+
+    def store(self, player, snapshot, taken):
+        """ Stores a snapshot if it differs from the player's latest one, always updates the checked time """
+        try:
+            connection = self.connect()
+            current = stack(snapshot)
+            with connection:
+                connection.execute('INSERT INTO players VALUES (?, ?, 0) '
+                                   'ON CONFLICT(player) DO UPDATE SET checked = excluded.checked', (player, taken))
+                latest = self.latest_snapshot(connection, player)
+                if latest is not None and np.array_equal(latest[1], current):
+                    return
+                if latest is None or latest[1].shape != current.shape or latest[2] + 1 >= KEYFRAME_INTERVAL:
+                    row = (taken, current.shape[1], current.tobytes())
+                    since_keyframe = 0
+                else:
+                    row = (taken, 0, encode_delta(latest[1], current))
+                    since_keyframe = latest[2] + 1
+                connection.execute('INSERT OR REPLACE INTO snapshot_rows VALUES (?, ?, ?, ?)', (player, *row))
+            self.remember(player, (taken, current, since_keyframe))
+        except sqlite3.Error:
+            self.latest.pop(player, None)
+            logging.exception(f'Could not store the hiscore snapshot of {player}')
+
+    def read_history(self, player, since):
+        """ Returns the player's History from since until now, None if nothing is stored """
+        connection = self.connect()
+        checked = connection.execute('SELECT checked FROM players WHERE player = ?', (player,)).fetchone()
+        if checked is None:
+            return None
+        # The window starts at the last snapshot before since (or the first one after it),
+        # decoding starts at the keyframe before that
+        (anchor,) = connection.execute('SELECT COALESCE((SELECT MAX(taken) FROM snapshot_rows WHERE player = ? '
+                                       'AND taken <= ?), (SELECT MIN(taken) FROM snapshot_rows WHERE player = ?))',
+                                       (player, since, player)).fetchone()
+        if anchor is None:
+            return None
+        rows = connection.execute('SELECT taken, width, data FROM snapshot_rows WHERE player = ? AND taken >= '
+                                  '(SELECT MAX(taken) FROM snapshot_rows WHERE player = ? AND width > 0 AND taken <= ?) '
+                                  'ORDER BY taken', (player, player, anchor)).fetchall()
+        snapshots = [(taken, matrix) for (taken, matrix) in decode(rows) if taken >= anchor]
+        # Only snapshots with the latest layout can be compared column by column
+        width = snapshots[-1][1].shape[1]
+        snapshots = [(taken, matrix) for (taken, matrix) in snapshots if matrix.shape[1] == width]
+        taken = np.array([taken for (taken, _) in snapshots], dtype=np.float64)
+        matrices = np.stack([matrix for (_, matrix) in snapshots])
+        return History(taken, matrices[:, 0], matrices[:, 1], matrices[:, 2], checked[0])
+
+    async def history(self, player, since):
+        """ Returns the player's History from since until now, None if nothing is stored """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.read_history, player, since)
+
+    def read_last_seen(self, player):
+        """ Returns the times of the player's latest snapshot and last check, None if nothing is stored """
+        connection = self.connect()
+        latest = connection.execute('SELECT (SELECT MAX(taken) FROM snapshot_rows WHERE player = ?), checked '
+                                    'FROM players WHERE player = ?', (player, player)).fetchone()
+        if latest is None or latest[0] is None:
+            return None
+        return latest
+
+    async def last_seen(self, player):
+        """ Returns the times of the player's latest snapshot and last check, None if nothing is stored """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.read_last_seen, player)
+
+    def compact_player(self, connection, player, now):
+        """ Drops the snapshots the retention policy doesn't keep and re-encodes the rest """
+        rows = connection.execute('SELECT taken, width, data FROM snapshot_rows WHERE player = ? ORDER BY taken',
+                                  (player,)).fetchall()
+        snapshots = decode(rows)
+        keep = retained([taken for (taken, _) in snapshots], now)
+        if not keep.all():
+            kept = [snapshot for (snapshot, kept) in zip(snapshots, keep) if kept]
+            connection.execute('DELETE FROM snapshot_rows WHERE player = ?', (player,))
+            connection.executemany('INSERT INTO snapshot_rows VALUES (?, ?, ?, ?)',
+                                   [(player, *row) for row in encode([taken for (taken, _) in kept],
+                                                                     [matrix for (_, matrix) in kept])])
+            # Its keyframe count changed
+            self.latest.pop(player, None)
+        connection.execute('UPDATE players SET compacted = ? WHERE player = ?', (now, player))
+        return len(rows) - int(keep.sum())
+
+    def compact_batch(self, now):
+        """ Compacts the next COMPACT_BATCH players that are due, returns (players, snapshots dropped) """
+        try:
+            connection = self.connect()
+            with connection:
+                players = [player for (player,) in connection.execute(
+                    'SELECT player FROM players WHERE compacted <= ? LIMIT ?', (now - COMPACT_INTERVAL, COMPACT_BATCH))]
+                dropped = sum(self.compact_player(connection, player, now) for player in players)
+            return len(players), dropped
+        except sqlite3.Error:
+            logging.exception('Could not compact the hiscore snapshots')
+            return 0, 0
+
+    async def compact(self):
+        """ Applies the retention policy to every player due, a batch at a time on the worker thread """
+        loop = asyncio.get_event_loop()
+        now = time.time()
+        players = dropped = 0
+        while True:
+            (batch, batch_dropped) = await loop.run_in_executor(self.executor, self.compact_batch, now)
+            players += batch
+            dropped += batch_dropped
+            if batch < COMPACT_BATCH:
+                break
+        logging.info(f'Compacted the snapshots of {players} players, dropped {dropped}')
+        return players, dropped
+
+    def close(self):
+        """ Finishes queued writes and closes the database """
+        self.executor.shutdown(wait=True)
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+# Shared by the hiscore cache and the tracker
+snapshot_store = SnapshotStore()
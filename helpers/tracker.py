@@ -1,155 +1,115 @@
-# Crystal Math Labs xp tracker
+# Local xp tracker, gains are worked out from the stored hiscore snapshots
 
-import asyncio
-import logging
-import requests
-from bs4 import BeautifulSoup
+import time as clock
+
+import numpy as np
 from tabulate import tabulate
 
-cml_url = 'https://crystalmathlabs.com/tracker/track.php?player='
-cml_update_url = 'https://crystalmathlabs.com/tracker/update.php?player='
-cml_boss_url = 'https://crystalmathlabs.com/tracker/bosstrack.php?player='
-cml_stats_url = 'https://crystalmathlabs.com/tracker/view_stats.php?player='
-cml_sig = 'http://crystalmathlabs.com/tracker/sig.php?name='
-cml_logo = 'https://crystalmathlabs.com/tracker/images/logo.png'
+from calcs.experience import levels_for_xp
+from helpers import http
+from helpers.cache import note_stale
+from helpers.hiscore import hiscore_cache, canonical_username, HiscoreUnavailable, HISCORE_HARD_TTL
+from helpers.hiscore_schema import SCHEMAS, LATEST
+from helpers.snapshots import snapshot_store
+from helpers.urls import hiscore_url, get_icon_url
+
+# Tracker windows in days
+TRACKER_WINDOWS = {'7d': 7, '30d': 30, '365d': 365}
+DAY = 24 * 60 * 60
 
 
-def cml_track(username, duration):
-    return f'https://crystalmathlabs.com/tracker/api.php?type=track&player={username}&time={duration}'
+def ago(seconds):
+    """ Formats a duration the way the tracker footer shows it, 3 hours """
+    for (unit, length) in (('day', DAY), ('hour', 60 * 60), ('minute', 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f'{count} {unit}{"s" if count > 1 else ""}'
+    return 'less than a minute'
 
 
 class Tracker:
-    """ Crystal Math Labs xp tracking class """
+    """ XP tracker over the snapshots stored from every hiscore lookup """
 
     def __init__(self, username):
         self.username = username
-        self.logo = cml_logo
+        self.logo = get_icon_url('overall')
+        self.url = hiscore_url + username
         if username == '':
             raise NoUsername('You must type a username after the command.\n'
                              'Type `!b help xp` for more information.')
 
     async def fetch(self, time='7d', update=True):
-        """ Fetch CML results """
-        # Event loop
-        loop = asyncio.get_event_loop()
-        # Update results if able
-        update_req = loop.run_in_executor(None, requests.get, cml_update_url + self.username)
-        # Await update page
+        """ Works out gains over the window from the stored snapshots.
+        update takes a fresh snapshot first (through the hiscore cache), which also happens if none are stored.
+        While the hiscores are down, the stored snapshots are used if the player was checked within the hard TTL """
+        key = canonical_username(self.username)
+        since = clock.time() - TRACKER_WINDOWS[time] * DAY
+        unavailable = None
         if update:
-            update_response = await update_req
-        # Get username's page
-        self.url = cml_url + self.username + f'&time={time}'
-        req = loop.run_in_executor(None, requests.get, self.url)
-        # Boss kill request
-        boss_req = loop.run_in_executor(None, requests.get, cml_boss_url + self.username + f'&time={time}')
-        # Stats request
-        stats_req = loop.run_in_executor(None, requests.get, cml_stats_url + self.username + f'&time={time}')
-        # Await requests
-        response = await req
-        boss_res = await boss_req
-        stats_res = await stats_req
-        if response.status_code == 404:
-            raise UserNotFound(f'No data for {self.username}.')
-        # Parse responses
-        doc = BeautifulSoup(response.content, 'html.parser')
-        boss_doc = BeautifulSoup(boss_res.content, 'html.parser')
-        stats_doc = BeautifulSoup(stats_res.content, 'html.parser')
-
-        # Put results in an array of tuples
-        # (Skill name, XP gained, Rank change, Levels gained, EHP)
-        response = doc.find_all('tr')
-        self.results = []
-        for i in response[1:-1]:
-            # Parse
-            name = i.a.text
-            if name.strip() == 'EHP':
-                break
-            search = i.find_all('td')
-            no_commas = search[1].text.replace(',', '')
-            no_plus = no_commas.replace('+', '')
-            xp_gained = int(no_plus)
-            rank_change = search[2].text
-            levels_gained = search[3].text
-            ehp = search[4].text
-            # record = search[5].text
-            # Store results
-            self.results.append((name, xp_gained, rank_change, levels_gained, ehp))
-
-        # Sort results by xp gained (second item in tuple)
-        # https://stackoverflow.com/a/3121985
-        self.top_gains = sorted(self.results, key=lambda tup: tup[1], reverse=True)
-        for (name, xp, rank, levels, ehp) in self.top_gains:
-            if name == 'Overall':
-                if xp == 0:
-                    raise NoDataPoints(f'Either this is the first time {self.username} has been tracked this week, '
-                                       f'or no XP has been gained. Gain some more XP and try again.\n\n'
-                                       '(This command is more useful if you use it often.)')
-
-        # Extract last changed time
-        details_response = doc.find_all('div', {"id": "track_details"})
-        details_search = details_response[0].find_all('span')
-        self.results_duration = details_search[0].text
-        self.oldest_data = details_search[2].text
-        self.last_checked = details_search[6].text
-        self.last_changed = details_search[8].text
-
-        # Boss kill counts
-        boss_response = boss_doc.find_all('tr')
-        self.boss_kills = []
-        for i in boss_response[1:-1]:
-            name = i.a.text
-            boss_search = i.find_all('td')
-            no_commas = boss_search[1].text.replace(',', '')
-            no_plus = no_commas.replace('+', '')
-            kills = int(no_plus)
-            rank = boss_search[2].text
-            self.boss_kills.append((name, kills, rank))
-
-        # Sort boss kills array
-        self.top_kills = sorted(self.boss_kills, key=lambda tup: tup[1], reverse=True)
-
-        # Get stats
-        stats_response = stats_doc.find_all('tr')
-        self.stats = []
-        for i in stats_response[1:-1]:
-            # Parse
-            search = i.find_all('td')
-            name = search[0].text
-            if name.strip() == 'EHP':
-                break
-            xp = search[1].text.replace(',', '')
-            rank = search[2].text.replace(',', '')
-            lvl = search[3].text.replace(',', '')
-            # Store results
-            self.stats.append((name, xp, rank, lvl))
+            try:
+                await hiscore_cache.get(self.username)
+            except (HiscoreUnavailable, *http.UPSTREAM_ERRORS) as error:
+                unavailable = error
+        history = await snapshot_store.history(key, since)
+        if unavailable is not None:
+            if history is None or clock.time() - history.checked >= HISCORE_HARD_TTL:
+                raise unavailable
+            note_stale(history.checked)
+        if history is None and not update:
+            await hiscore_cache.get(self.username)
+            history = await snapshot_store.history(key, since)
+        if history is None or len(history) < 2:
+            raise NoDataPoints(f'This is the first time {self.username} has been tracked this period, '
+                               f'or no XP has been gained. Gain some more XP and try again.\n\n'
+                               '(This command is more useful if you use it often.)')
+        schema = SCHEMAS.get(history.xp.shape[1], LATEST)
+        now = clock.time()
+        self.results_duration = time
+        self.oldest_data = ago(now - history.taken[0])
+        self.last_changed = ago(now - history.taken[-1])
+        self.last_checked = ago(now - history.checked)
+
+        # Skills, overall first: (name, xp gained, rank change, levels gained)
+        rows = np.array([0] + [row for (_, row) in schema.level_rows])
+        names = ['Overall'] + [name for (name, _) in schema.level_rows]
+        xp = np.maximum(history.xp[:, rows], 0)
+        rank = history.rank[:, rows]
+        gained = xp[-1] - xp[0]
+        # Positive when the player climbed, unranked rows don't count
+        rank_change = np.where((rank[0] > 0) & (rank[-1] > 0), rank[0] - rank[-1], 0)
+        levels = levels_for_xp(xp)
+        levels[:, 0] = np.maximum(history.score[:, 0], 0)
+        levels_gained = levels[-1] - levels[0]
+        self.results = list(zip(names, gained.tolist(), rank_change.tolist(), levels_gained.tolist()))
+        self.stats = list(zip(names, xp[-1].tolist(), rank[-1].tolist(), levels[-1].tolist()))
+        self.total_level = int(levels[-1, 0])
+
+        # Sort results by xp gained (overall stays first, it is the sum)
+        self.top_gains = sorted(self.results, key=lambda gain: gain[1], reverse=True)
+
+        # Boss kill counts gained
+        kc_rows = np.array([row for (_, row) in schema.kc_rows], dtype=np.intp)
+        kills = np.maximum(history.score[:, kc_rows], 0)
+        kills_gained = kills[-1] - kills[0]
+        self.boss_kills = [(name, int(gain), int(history.rank[-1, row]))
+                           for ((name, row), gain) in zip(schema.kc_rows, kills_gained)]
+        self.top_kills = sorted(self.boss_kills, key=lambda kill: kill[1], reverse=True)
+
+        if gained[0] == 0 and kills_gained.sum() == 0:
+            raise NoDataPoints(f'{self.username} hasn\'t gained any XP or kills in the last {time}. '
+                               f'Last change was {self.last_changed} ago.')
 
     def get_lvl(self, name):
-        """ Returns the lvl for a stat """
+        """ Returns the (virtual) lvl for a stat """
         for (skill, xp, rank, lvl) in self.stats:
             if name.strip() == skill.strip():
                 return lvl
 
-    def get_non_virtual_lvl(self, name):
-        """ Returns the non-virtal lvl for a stat """
-        overall = 0
-        for (skill, xp, rank, lvl) in self.stats[1:]:
-            if int(lvl) > 99:
-                overall += 99
-            else:
-                overall += int(lvl)
-            if name.strip() == skill.strip():
-                if int(lvl) > 99:
-                    return 99
-                else:
-                    return lvl
-        if name.strip() == 'Overall':
-            return overall
-
     def generate_table(self, skills=5):
         """ Returns a formatted table of top 5 gains """
         results = []
         results.append(('Skill', 'Lvl', 'XP'))
-        for (name, xp, rank, levels, ehp) in self.top_gains[1:skills + 1]:
+        for (name, xp, rank, levels) in self.top_gains[1:skills + 1]:
             if xp > 0:
                 high_level = int(self.get_lvl(name))
                 low_level = high_level - int(levels)
@@ -171,13 +131,6 @@ class Tracker:
             return None
         return tabulate(results, tablefmt='plain')
 
-    def get_sig(self):
-        return f'{cml_sig}{self.username}'
-
-
-class UserNotFound(TypeError):
-    pass
-
 
 class NoDataPoints(Exception):
     pass
@@ -12,6 +12,12 @@ ge_url = 'http://services.runescape.com/m=itemdb_oldschool/results?query='
 ge_api_url = 'http://services.runescape.com/m=itemdb_oldschool'
 ge_api_item_url = ge_api_url + '/api/catalogue/detail.json?item='  # + itemID
 ge_graph_url = ge_api_url + '/api/graph/'  # + itemID.json
+ge_icon_url_base = 'https://secure.runescape.com/m=itemdb_oldschool/obj_big.gif?id='
+
+
+def ge_icon_url(item_id):
+    return f'{ge_icon_url_base}{item_id}'
+
 
 def ge_query_url(query):
     return f'{ge_api_url}/api/catalogue/items.json?category=1&alpha={query}&page=1'
@@ -4,11 +4,21 @@ import pytz
 from discord.ext import commands, tasks
 from datetime import datetime
 
+from helpers import http
 from helpers.api_key import discord_key, owner_id, error_channel_id
+from helpers.cache import served_stale
 from helpers.descriptions import bot_description, wrong_message
-from helpers.ge import MissingQuery, NoResults
+from calcs.dry import NoDrop, dry_simulator
+from helpers.ge import MissingQuery, NoResults, GEUnavailable
+from helpers.graphs import graph_renderer
 from helpers.hiscore import UserNotFound, MissingUsername, HiscoreUnavailable
-from helpers.tracker import NoDataPoints, NoUsername
+from helpers.item_index import item_index
+from helpers.itemdb import item_db
+from helpers.monsters import monster_index
+from helpers.price_history import price_history
+from helpers.price_table import price_table
+from helpers.snapshots import snapshot_store
+from helpers.tracker import NoDataPoints, NoUsername, ago
 from helpers.version import get_version
 
 logging.basicConfig(filename='bot.log',
@@ -23,10 +33,38 @@ def get_prefix(client, message):
     return commands.when_mentioned_or(*prefixes)(client, message)
 
 
-bot = commands.Bot(command_prefix=get_prefix,
-                   description=bot_description,
-                   owner_id=owner_id,
-                   case_insensitive=True)
+class Context(commands.Context):
+    """ Marks embeds built from stale hiscore or GE data with how old that data is """
+
+    async def send(self, content=None, **kwargs):
+        embed = kwargs.get('embed')
+        stale = served_stale.get()
+        if embed is not None and stale:
+            as_of = f'As of {ago(datetime.now().timestamp() - min(stale))} ago, refreshing'
+            footer = f'{embed.footer.text}\n{as_of}' if embed.footer.text else as_of
+            embed.set_footer(text=footer, icon_url=embed.footer.icon_url)
+        return await super().send(content, **kwargs)
+
+
+class Bot(commands.Bot):
+    """ Bot that releases the shared HTTP session and worker processes on shutdown """
+
+    async def get_context(self, message, *, cls=Context):
+        return await super().get_context(message, cls=cls)
+
+    async def close(self):
+        await http.close()
+        graph_renderer.close()
+        dry_simulator.close()
+        snapshot_store.close()
+        price_history.close()
+        await super().close()
+
+
+bot = Bot(command_prefix=get_prefix,
+          description=bot_description,
+          owner_id=owner_id,
+          case_insensitive=True)
 
 bot.remove_command('help')
 cogs = ['cogs.links', 'cogs.levels', 'cogs.calculators', 'cogs.scores', 'cogs.embed_help.help',
@@ -40,6 +78,10 @@ async def on_ready():
         logging.info(f'Loading {cog}')
         bot.load_extension(cog)
     logging.info("Cogs loaded")
+    item_db.start()
+    item_index.start()
+    price_table.start()
+    monster_index.start()
     print(f'Up and running as {bot.user.name}')
     return
 
@@ -52,7 +94,8 @@ async def on_message(message):
         embed = discord.Embed(title='!blue', description='Type `!b help` for a list of commands.')
         await channel.send(embed=embed)
         return
-    # Pass message onto the rest of the commands
+    # Pass message onto the rest of the commands, noting any stale data they serve
+    served_stale.set([])
     await bot.process_commands(message)
 
 
@@ -66,8 +109,15 @@ async def on_command_error(ctx, error):
     if isinstance(error, discord.ext.commands.errors.CommandNotFound):
         pass
     elif isinstance(error, UserNotFound) or isinstance(error, NoDataPoints) or isinstance(error, NoResults)\
-            or isinstance(error, HiscoreUnavailable) or isinstance(error, NoUsername):
+            or isinstance(error, NoUsername) or isinstance(error, NoDrop):
+        msg += f'{error}\n'
+    elif isinstance(error, HiscoreUnavailable) or isinstance(error, GEUnavailable) \
+            or isinstance(error, http.CircuitOpen):
         msg += f'{error}\n'
+        circuit = error if isinstance(error, http.CircuitOpen) else error.__cause__
+        if isinstance(circuit, http.CircuitOpen):
+            msg += f'Requests to `{circuit.host}` are paused while it keeps failing: ' \
+                   f'{http.host_limit(circuit.host).status()}\n'
     elif isinstance(error, MissingUsername) or isinstance(error, MissingQuery):
         msg += f'{error}\n' \
                f'Type `!b help {ctx.command}` to see the usage for the command.\n'